@@ -0,0 +1,78 @@
+"""
+M0 下載吞吐量基準測試（離線）
+
+以 FakeSource 模擬網路延遲與錯誤率，量測 DataLoader 在不同平行度下的
+吞吐量、重試次數，以及重播快取第二次執行的命中率與節省時間（命中時不等待下載間隔）。不需網路連線。
+
+用法:
+    python benchmarks/bench_m0_loader.py [--symbols 20] [--latency 0.05] [--error-rate 0.1] [--delay 0.02]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.config import Config
+from modules.m0_data_loader import DataLoader
+from modules.m0_data_sources import FakeSource, ReplayCacheSource
+
+
+def make_config(root: Path, args) -> Config:
+    config = Config(data_dir=root / "data", cache_dir=root / "cache")
+    config.download_delay = args.delay
+    config.download_jitter = (0.0, 0.0)
+    config.retry_base = 0.0
+    config.retry_jitter = (args.retry_wait, args.retry_wait)
+    config.date_chunk_size = args.chunk_days
+    return config
+
+
+def run_once(config: Config, source, symbols: list, args, workers: int) -> dict:
+    loader = DataLoader(config, source=source)
+    t0 = time.perf_counter()
+    stats = loader.run(symbols, args.start, args.end, auto_fill=False, max_workers=workers)
+    elapsed = time.perf_counter() - t0
+    return dict(stats, elapsed=elapsed, req_per_sec=stats['requests'] / elapsed if elapsed else float('inf'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="M0 下載吞吐量基準測試（離線）")
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2023-12-31')
+    parser.add_argument('--chunk-days', type=int, default=180)
+    parser.add_argument('--latency', type=float, default=0.05, help="每次請求延遲（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.1, help="請求失敗機率")
+    parser.add_argument('--delay', type=float, default=0.02, help="下載間隔（秒），重播快取命中時不套用")
+    parser.add_argument('--retry-wait', type=float, default=0.01, help="重試等待（秒）")
+    parser.add_argument('--workers', default='1,4,8', help="平行度（逗號分隔）")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    symbols = [f"SYM{i:04d}" for i in range(args.symbols)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            config = make_config(Path(tmp) / f"w{workers}", args)
+            source = FakeSource(latency=args.latency, error_rate=args.error_rate, seed=workers)
+            r = run_once(config, source, symbols, args, workers)
+            print(f"workers={workers:>2}: {r['elapsed']:.2f} s, {r['req_per_sec']:.1f} req/s, "
+                  f"requests={r['requests']} errors={r['errors']} retries={r['retries']} rows={r['rows']}")
+
+        # 重播快取：第一次寫入快取，第二次應全部命中且不再呼叫來源
+        config = make_config(Path(tmp) / "replay", args)
+        fake = FakeSource(latency=args.latency, error_rate=0.0)
+        cached = ReplayCacheSource(fake, config.cache_dir)
+        first = run_once(config, cached, symbols, args, 4)
+        calls = fake.calls
+        second = run_once(config, cached, symbols, args, 4)
+        print(f"replay: 首次 {first['elapsed']:.2f} s，重播 {second['elapsed']:.2f} s，"
+              f"快取命中 {cached.hits}/{cached.hits + cached.misses}，重播期間來源呼叫 {fake.calls - calls} 次")
+
+
+if __name__ == '__main__':
+    main()
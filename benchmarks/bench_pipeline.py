@@ -0,0 +1,263 @@
+"""
+端對端效能回歸測試
+
+以離線模擬資料跑完整流程：合成股票池（M0, FakeSource）→ M1 參數掃描 → M2 回測 → M3 報告，
+記錄每個階段的執行時間、記憶體峰值（行程 RSS 與 tracemalloc）、新增檔案數與寫入位元組數，
+並與基準檔比較，超出容許範圍時以非零結束碼結束。
+
+每個階段各自在獨立子行程執行，RSS 峰值只反映該階段：
+  - 計時回合：不啟用 tracemalloc，量測執行時間、RSS 峰值與檔案變化。
+  - 追蹤回合：於該階段執行前的資料夾複本上啟用 tracemalloc，量測 Python 配置峰值。
+
+用法:
+    python benchmarks/bench_pipeline.py                    # 與基準比較
+    python benchmarks/bench_pipeline.py --update-baseline  # 以本次結果更新基準
+    python benchmarks/bench_pipeline.py --symbols 50 --params 100 --baseline other.json
+
+基準數值與機器相關，更換執行環境（如 CI 主機）時請先以 --update-baseline 重建。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows 無 resource 模組
+    resource = None
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "pipeline_baseline.json"
+STAGES = ('M0', 'M1', 'M2', 'M3')
+WORKLOAD_KEYS = ('symbols', 'params', 'start', 'end', 'signal_format', 'seed')
+
+# 各指標容許範圍：本次 <= 基準 × 倍率 + 絕對寬限（避免極小數值因雜訊誤判）
+TOLERANCES = {
+    'seconds': (1.5, 0.1),
+    'peak_rss_mb': (1.25, 5.0),
+    'rss_growth_mb': (1.25, 5.0),
+    'peak_traced_mb': (1.25, 1.0),
+    'files': (1.10, 0),
+    'bytes': (1.25, 4096),
+}
+
+
+def peak_rss_mb():
+    """行程至今的 RSS 峰值（MB），不支援時回傳 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def scan(root: Path) -> tuple:
+    """回傳 (檔案數, 總位元組數)"""
+    files, size = 0, 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+def build_config(root: Path):
+    from utils.config import Config
+
+    config = Config(
+        data_dir=root / "data",
+        signals_dir=root / "signals",
+        results_dir=root / "results",
+        reports_dir=root / "reports",
+        cache_dir=root / "cache",
+    )
+    for d in (config.data_dir, config.signals_dir, config.results_dir, config.reports_dir):
+        os.makedirs(d, exist_ok=True)
+    config.download_delay = 0.0
+    config.download_jitter = (0.0, 0.0)
+    config.date_chunk_size = 3650
+    return config
+
+
+def stage_func(stage: str, root: Path, args):
+    """回傳執行指定階段的函式（模組於此載入，不計入階段時間）"""
+    from modules.m0_data_loader import DataLoader
+    from modules.m0_data_sources import FakeSource
+    from modules.m1_signal_generator import SignalGenerator
+    from modules.m2_backtester import Backtester
+    from modules.m3_report_generator import ReportGenerator
+    from utils.signal_store import SignalEventStore
+
+    config = build_config(root)
+    symbols = [f"SYM{i:04d}" for i in range(args.symbols)]
+    param_space = [{'short_period': s, 'long_period': s * 3} for s in range(5, 5 + 5 * args.params, 5)]
+
+    def signal_dir(symbol):
+        return config.signals_dir / f"SMA_CROSS_{symbol}_bench"
+
+    def m0():
+        DataLoader(config, source=FakeSource(seed=args.seed)).run(symbols, args.start, args.end)
+
+    def m1():
+        for symbol in symbols:
+            generator = SignalGenerator(config)
+            generator.signals_dir = signal_dir(symbol)
+            os.makedirs(generator.signals_dir, exist_ok=True)
+            generator.run(symbol, 'SMA_CROSS', param_space, save_format=args.signal_format)
+
+    def m2():
+        backtester = Backtester(config)
+        for symbol in symbols:
+            for name in sorted(os.listdir(signal_dir(symbol))):
+                path = str(signal_dir(symbol) / name)
+                if SignalEventStore.is_event_file(name):
+                    backtester.run_events(path, symbol)
+                elif name.endswith('.csv') and name.startswith('SMA_CROSS_'):
+                    backtester.run(path, symbol)
+
+    def m3():
+        reporter = ReportGenerator(config.reports_dir)
+        summary = str(config.results_dir / "performance_master.csv")
+        reporter.run(summary, 'total_return', top_n=10, export_format='csv', mode='rank')
+        reporter.run(summary, 'total_return', top_n=10, export_format='csv', mode='bundle')
+
+    return {'M0': m0, 'M1': m1, 'M2': m2, 'M3': m3}[stage]
+
+
+def worker(args):
+    """子行程：執行單一階段並將量測結果寫入 JSON"""
+    import tracemalloc
+
+    logging.disable(logging.CRITICAL)
+    func = stage_func(args.stage, Path(args.root), args)
+    rss_before = peak_rss_mb()
+    if args.traced:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - t0
+    result = {'seconds': seconds}
+    if args.traced:
+        result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    rss_after = peak_rss_mb()
+    if rss_after is not None:
+        result['peak_rss_mb'] = rss_after
+        result['rss_growth_mb'] = rss_after - rss_before
+    Path(args.result).write_text(json.dumps(result), encoding='utf-8')
+
+
+def run_stage(stage: str, root: Path, args, trace: bool) -> dict:
+    """以子行程執行單一階段"""
+    result_path = root.parent / f"{stage}_{'trace' if trace else 'time'}.json"
+    cmd = [sys.executable, os.path.abspath(__file__), '--stage', stage, '--root', str(root),
+           '--result', str(result_path)] + (['--traced'] if trace else [])
+    for key in WORKLOAD_KEYS:
+        cmd += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return json.loads(result_path.read_text(encoding='utf-8'))
+
+
+def run_pipeline(tmp: Path, args) -> dict:
+    work = tmp / "work"
+    work.mkdir()
+    results = {}
+    for stage in STAGES:
+        snapshot = tmp / f"pre_{stage}"
+        if args.trace:
+            shutil.copytree(work, snapshot)
+        files_before, bytes_before = scan(work)
+        timed = run_stage(stage, work, args, trace=False)
+        files_after, bytes_after = scan(work)
+        r = {
+            'seconds': round(timed['seconds'], 4),
+            'peak_rss_mb': None if 'peak_rss_mb' not in timed else round(timed['peak_rss_mb'], 1),
+            'rss_growth_mb': None if 'rss_growth_mb' not in timed else round(timed['rss_growth_mb'], 1),
+            'peak_traced_mb': None,
+            'files': files_after - files_before,
+            'bytes': bytes_after - bytes_before,
+        }
+        if args.trace:
+            # 追蹤回合在階段執行前的複本上重跑，結果與計時回合相同但不影響計時
+            r['peak_traced_mb'] = round(run_stage(stage, snapshot, args, trace=True)['peak_traced_mb'], 3)
+            shutil.rmtree(snapshot)
+        results[stage] = r
+        print(f"{stage:<3} {r['seconds']:>8.2f} s  rss {r['peak_rss_mb'] or 0:>7.1f} MB (+{r['rss_growth_mb'] or 0:>6.1f})  "
+              f"traced {r['peak_traced_mb'] or 0:>7.2f} MB  files {r['files']:>6}  bytes {r['bytes']:>12,}")
+    return results
+
+
+def compare(results: dict, baseline: dict, scale: float) -> list:
+    """回傳超出容許範圍的項目"""
+    failures = []
+    for stage, metrics in baseline.get('stages', {}).items():
+        for key, base in metrics.items():
+            current = results.get(stage, {}).get(key)
+            if current is None or base is None or key not in TOLERANCES:
+                continue
+            ratio, slack = TOLERANCES[key]
+            limit = base * ratio * (scale if key == 'seconds' else 1.0) + slack
+            if current > limit:
+                failures.append(f"{stage}.{key}: {current} > {limit:.4g}（基準 {base}）")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quanta II 端對端效能回歸測試")
+    parser.add_argument('--symbols', type=int, default=5)
+    parser.add_argument('--params', type=int, default=10)
+    parser.add_argument('--start', default='2015-01-01')
+    parser.add_argument('--end', default='2020-01-01')
+    parser.add_argument('--signal-format', default='csv', choices=['csv', 'events'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="以本次結果覆寫基準檔")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="時間容許倍率再乘上此值（較慢機器可放寬）")
+    parser.add_argument('--no-trace', dest='trace', action='store_false', help="略過 tracemalloc 追蹤回合")
+    # 子行程內部使用
+    parser.add_argument('--stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    parser.add_argument('--traced', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        worker(args)
+        return
+
+    workload = {k: getattr(args, k) for k in WORKLOAD_KEYS}
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_pipeline(Path(tmp), args)
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({'workload': workload, 'stages': results}, indent=2), encoding='utf-8')
+        print(f"已更新基準：{args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"找不到基準檔 {args.baseline}，請先執行 --update-baseline")
+        sys.exit(2)
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+    if baseline.get('workload') != workload:
+        print(f"工作量設定與基準不同，無法比較：基準 {baseline.get('workload')}，本次 {workload}")
+        sys.exit(2)
+    failures = compare(results, baseline, args.time_scale)
+    if failures:
+        print("效能回歸：")
+        for f in failures:
+            print(f"  - {f}")
+        sys.exit(1)
+    print("未發現效能回歸。")
+
+
+if __name__ == '__main__':
+    main()
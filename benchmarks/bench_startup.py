@@ -0,0 +1,78 @@
+"""
+啟動時間基準測試
+
+量測各入口在全新 Python 行程中的匯入時間（取多次中位數），並檢查:
+  - main_controller 啟動時不載入 pandas / numpy / yfinance
+  - 各入口匯入時間不超過預算（秒）
+
+用法:
+    python benchmarks/bench_startup.py [--repeat 7] [--scale 1.0]
+
+超出預算或載入了不該載入的套件時以非零結束碼結束，可直接接入排程或 CI。
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口: (匯入語句, 預算秒數, 不應載入的套件)
+TARGETS = {
+    'main_controller': ("import main_controller", 0.15, ['pandas', 'numpy', 'yfinance']),
+    'm3_report_generator': ("import modules.m3_report_generator", 1.5, ['yfinance']),
+    'm2_backtester': ("import modules.m2_backtester", 1.5, ['yfinance']),
+    'm1_signal_generator': ("import modules.m1_signal_generator", 1.5, ['yfinance']),
+}
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(stmt: str, forbidden: list, repeat: int) -> dict:
+    """在全新行程中重複匯入，回傳中位數時間與載入的禁用套件"""
+    times = []
+    loaded = set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(stmt=stmt, forbidden=forbidden)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result['elapsed'])
+        loaded.update(result['loaded'])
+    return {'median': statistics.median(times), 'min': min(times), 'loaded': sorted(loaded)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quanta II 啟動時間基準測試")
+    parser.add_argument('--repeat', type=int, default=7, help="每個入口量測次數")
+    parser.add_argument('--scale', type=float, default=1.0, help="預算倍率（較慢機器可放寬）")
+    args = parser.parse_args()
+
+    failed = False
+    for name, (stmt, budget, forbidden) in TARGETS.items():
+        try:
+            result = measure(stmt, forbidden, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"[SKIP] {name}: 無法匯入（{e.stderr.strip().splitlines()[-1]}）")
+            continue
+        limit = budget * args.scale
+        ok = result['median'] <= limit and not result['loaded']
+        failed |= not ok
+        status = 'OK' if ok else 'FAIL'
+        extra = f"，載入了 {', '.join(result['loaded'])}" if result['loaded'] else ''
+        print(f"[{status}] {name}: 中位數 {result['median'] * 1000:.1f} ms"
+              f"（最小 {result['min'] * 1000:.1f} ms，預算 {limit * 1000:.0f} ms）{extra}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,11 @@
 import sys
 import os
-import datetime
+import json
+from pathlib import Path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from utils.config import Config
-from modules.m0_data_loader import DataLoader
-from modules.m1_signal_generator import SignalGenerator
-from modules.m2_backtester import Backtester
-from modules.m3_report_generator import ReportGenerator
-# 預留未來模組
-# from modules.m3_report_generator import ReportGenerator
+# 各模組（及 pandas、yfinance 等套件）於選單功能內才載入，縮短啟動時間
 
 def main():
     config = Config.load()
@@ -22,7 +18,9 @@ def main():
         print("2. 產生策略信號 (M1)")
         print("3. 策略回測 (M2)")
         print("4. 績效篩選與報告 (M3)")
-        print("5. 離開系統")
+        print("5. 穩健度分析 (M4)")
+        print("6. 參數平面分析 (M5)")
+        print("7. 離開系統")
 
         choice = input("請選擇功能編號：").strip()
 
@@ -33,40 +31,31 @@ def main():
         elif choice == '3':
             run_m2(config)
         elif choice == '4':
-            print("\n[M3: 績效篩選與報告模組]")
-            summary_path = input("1. 請輸入 summary 檔案路徑（如 results/performance_master.csv）：")
-            metric = input("2. 請輸入排序依據（如 total_return, max_drawdown）：")
-            
-            top_mode = input("3. 請選擇 Top 模式（n=Top N, p=Top %，預設 n）：").lower()
-            if top_mode == 'p':
-                top_percent = float(input("請輸入 Top % 百分比（如 10）："))
-                top_n = None
-            else:
-                top_n = int(input("請輸入 Top N 數量（如 10）："))
-                top_percent = None
-            
-            conditions = input("4. 請輸入篩選條件（如 total_return>=0.05, max_drawdown<=0.1，可留空）：")
-            export_format = input("5. 請選擇輸出格式（csv/xlsx/html，預設 csv）：").lower() or 'csv'
-            
-            reporter = ReportGenerator(config.reports_dir)
-            reporter.run(summary_path, metric, top_n, top_percent, conditions, export_format)
+            run_m3(config)
         elif choice == '5':
+            run_m4(config)
+        elif choice == '6':
+            run_m5(config)
+        elif choice == '7':
             print("已離開系統。")
             break
         else:
             print("請輸入正確選項。")
 
 def run_m0(config):
+    from modules.m0_data_loader import DataLoader
+
     print("\n[M0: 資料下載模組]")
     symbols = input("1. 請輸入股票代碼（逗號分隔）：").strip().upper().split(',')
     start_date = input("2. 請輸入開始日期 (YYYY-MM-DD)：").strip()
     end_date = input("3. 請輸入結束日期 (YYYY-MM-DD)：").strip()
     save_to_db = input("4. 是否存到 SQLite 資料庫？(True/False, 預設 False)：").strip() or 'False'
     auto_fill = input("5. 是否自動補齊資料？(True/False, 預設 True)：").strip() or 'True'
-    source = input("6. 資料來源？(預設 yfinance)：").strip() or 'yfinance'
+    source = input("6. 資料來源？(yfinance/fake, 預設 yfinance)：").strip() or 'yfinance'
     max_workers = input("7. 同時下載股票數量？(預設 3)：").strip() or '3'
     download_delay = input("8. 每支股票下載間隔（秒）？(預設 2)：").strip() or '2'
     date_chunk_size = input("9. 分段下載天數上限？(預設 180)：").strip() or '180'
+    use_cache = input("10. 是否使用重播快取（重複請求直接讀取磁碟）？(True/False, 預設 False)：").strip() or 'False'
 
     symbols = [s.strip() for s in symbols if s.strip()]
     save_to_db = save_to_db.lower() == 'true'
@@ -74,6 +63,8 @@ def run_m0(config):
     max_workers = int(max_workers)
     download_delay = float(download_delay)
     date_chunk_size = int(date_chunk_size)
+    config.use_replay_cache = use_cache.lower() == 'true'
+    config.data_source = source
 
     loader = DataLoader(config)
     loader.run(
@@ -88,14 +79,74 @@ def run_m0(config):
         date_chunk_size=date_chunk_size
     )
 
+def resume_m1(config, resume_dirs):
+    """依批次清單續跑中斷的信號產生批次（可輸入多股票批次 sweep_id 或單一 signals 子資料夾）"""
+    from modules.m1_signal_generator import SignalGenerator
+    from utils.sweep_manifest import SweepManifest
+
+    for d in [d.strip() for d in resume_dirs.split(',') if d.strip()]:
+        sweep_id = Path(d).name[len(SignalGenerator.SWEEP_PREFIX):-len('.jsonl')] if d.endswith('.jsonl') else d
+        if (config.signals_dir / SignalGenerator.sweep_filename(sweep_id)).exists():
+            generator = SignalGenerator(config)
+            subdirs = generator.run_sweep(sweep_id=sweep_id)
+            print(f"已續跑完成批次 {sweep_id}（{len(subdirs)} 支股票）")
+            continue
+        manifest = SweepManifest(d)
+        if not manifest.meta:
+            print(f"{d} 找不到批次進度清單，略過。")
+            continue
+        meta = manifest.meta
+        generator = SignalGenerator(config)
+        generator.signals_dir = Path(d)
+        generator.run(
+            symbol=meta['symbol'],
+            strategy=meta['strategy'],
+            param_space=meta['param_space'],
+            start_date=meta.get('start_date'),
+            end_date=meta.get('end_date'),
+            save_format=meta.get('save_format', 'csv'),
+            export_param_log=True,
+            resume=True
+        )
+        print(f"已續跑完成 {d}")
+
+def update_m1(config, signal_dirs):
+    """依 signal_state 增量更新批次信號，只計算 M0 新增的 K 棒"""
+    from modules.m1_signal_generator import SignalGenerator
+
+    for d in [d.strip() for d in signal_dirs.split(',') if d.strip()]:
+        generator = SignalGenerator(config)
+        generator.signals_dir = Path(d)
+        state_files = sorted(Path(d).glob('signal_state_*.json'))
+        if not state_files:
+            print(f"{d} 找不到增量更新狀態，請先執行完整信號產生。")
+            continue
+        for state_file in state_files:
+            state = json.loads(state_file.read_text(encoding='utf-8'))
+            generator.update(symbol=state['symbol'], strategy=state['strategy'])
+        print(f"已增量更新 {d}")
+
 def run_m1(config):
+    from modules.m1_signal_generator import SignalGenerator
+
     print("\n[M1: 策略產生模組]")
+    pending = SignalGenerator.pending_sweeps(config.signals_dir)
+    if pending:
+        print(f"未完成的批次：{', '.join(pending)}")
+    resume_dirs = input("0. 續跑或更新既有批次？請輸入批次 ID 或 signals 子資料夾（逗號分隔，留空則建立新批次）：").strip()
+    if resume_dirs:
+        mode = input("   模式？(resume=續跑中斷批次, update=增量更新新 K 棒，預設 resume)：").strip().lower() or 'resume'
+        if mode == 'update':
+            update_m1(config, resume_dirs)
+        else:
+            resume_m1(config, resume_dirs)
+        return
     strategy = input("1. 請輸入策略名稱（如 SMA_CROSS, RSI）：").strip().upper()
     symbols = input("2. 請輸入股票代碼（逗號分隔）：").strip().upper().split(',')
     start_date = input("3. 請輸入資料起始日 (YYYY-MM-DD)：").strip()
     end_date = input("4. 請輸入資料結束日 (YYYY-MM-DD)：").strip()
     param_mode = input("5. 參數輸入方式？(Auto/Manual, 預設 Auto)：").strip() or 'Auto'
-    save_format = input("6. signals 輸出格式？(csv/parquet, 預設 csv)：").strip() or 'csv'
+    save_format = input("6. signals 輸出格式？(csv/parquet/events, 預設 csv)：").strip() or 'csv'
     export_param_log = input("7. 是否匯出 param_log.json？(True/False, 預設 True)：").strip() or 'True'
 
     symbols = [s.strip() for s in symbols if s.strip()]
@@ -157,25 +208,23 @@ def run_m1(config):
         print("不支援的策略名稱。")
         return
 
-    # 新增：自動建立子資料夾存放本次所有 signal 檔案
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    for symbol in symbols:
-        subdir = config.signals_dir / f"{strategy}_{symbol}_{timestamp}"
-        os.makedirs(subdir, exist_ok=True)
-        generator = SignalGenerator(config)
-        generator.signals_dir = subdir  # 指定本次 signal 子資料夾
-        generator.run(
-            symbol=symbol,
-            strategy=strategy,
-            param_space=param_space,
-            start_date=start_date,
-            end_date=end_date,
-            save_format=save_format,
-            export_param_log=export_param_log
-        )
-    print(f"本次所有信號檔案已儲存於 {subdir}")
+    # 先寫入批次清單（含抽樣後的參數組合）再逐一產生，中斷後可由第 0 項輸入批次 ID 續跑
+    generator = SignalGenerator(config)
+    subdirs = generator.run_sweep(
+        symbols=symbols,
+        strategy=strategy,
+        param_space=param_space,
+        start_date=start_date,
+        end_date=end_date,
+        save_format=save_format,
+        export_param_log=export_param_log
+    )
+    print(f"本次所有信號檔案已儲存於 {config.signals_dir}（{len(subdirs)} 個股票子資料夾）")
 
 def run_m2(config):
+    from modules.m2_backtester import Backtester
+    from utils.signal_store import SignalEventStore
+
     print("\n[M2: 策略回測模組]")
     signal_files = input("1. 請輸入 signal 檔案路徑（可逗號分隔多個或資料夾，如 signals/SMA_CROSS_AAPL_0001.csv,signals/SMA_CROSS_TSLA_0001.csv 或 signals/SMA_CROSS_AAPL_20240608_001）：").strip()
     symbol = input("2. 請輸入股票代碼（如 AAPL）：").strip().upper()
@@ -186,21 +235,25 @@ def run_m2(config):
     trade_time = input("7. 請輸入交易時機（預設 next_open）：").strip() or 'next_open'
     export_perf = input("8. 是否匯出績效結果（True/False，預設 True）：").strip() or 'True'
     export_nav = input("9. 是否匯出 NAV 序列（True/False，預設 True）：").strip() or 'True'
+    resume = input("10. 是否略過已完成的回測（續跑）？(True/False，預設 True)：").strip() or 'True'
 
     export_perf = export_perf.lower() == 'true'
     export_nav = export_nav.lower() == 'true'
+    resume = resume.lower() == 'true'
 
     backtester = Backtester(config)
     # 支援 signal 檔案路徑為資料夾
     all_files = []
     for f in [f.strip() for f in signal_files.split(',') if f.strip()]:
         if os.path.isdir(f):
-            all_files.extend([os.path.join(f, x) for x in os.listdir(f) if x.endswith('.csv')])
+            all_files.extend([os.path.join(f, x) for x in os.listdir(f) if x.endswith('.csv') or SignalEventStore.is_event_file(x)])
         else:
             all_files.append(f)
     for signal_file in all_files:
-        backtester.run(
-            signal_file=signal_file,
+        # 信號事件檔內含多組參數，逐一展開回測
+        run = backtester.run_events if SignalEventStore.is_event_file(signal_file) else backtester.run
+        run(
+            signal_file,
             symbol=symbol,
             initial_cash=initial_cash,
             fee=fee,
@@ -208,8 +261,74 @@ def run_m2(config):
             position=position,
             trade_time=trade_time,
             export_perf=export_perf,
-            export_nav=export_nav
+            export_nav=export_nav,
+            resume=resume
         )
 
+def run_m3(config):
+    from modules.m3_report_generator import ReportGenerator
+
+    print("\n[M3: 績效篩選與報告模組]")
+    summary_path = input("1. 請輸入 summary 檔案路徑（如 results/performance_master.csv）：")
+    metric = input("2. 請輸入排序依據（如 total_return, max_drawdown）：")
+    
+    top_mode = input("3. 請選擇 Top 模式（n=Top N, p=Top %，預設 n）：").lower()
+    if top_mode == 'p':
+        top_percent = float(input("請輸入 Top % 百分比（如 10）："))
+        top_n = None
+    else:
+        top_n = int(input("請輸入 Top N 數量（如 10）："))
+        top_percent = None
+    
+    conditions = input("4. 請輸入篩選條件（如 total_return>=0.05, max_drawdown<=0.1，可留空）：")
+    export_format = input("5. 請選擇輸出格式（csv/xlsx/html/all，預設 csv）：").lower() or 'csv'
+    mode = input("6. 報告模式（single=單一股票, bundle=報告包, rank=跨股票排名與參數穩定度，預設 single）：").strip().lower() or 'single'
+    thumbnails = False
+    if mode == 'bundle':
+        thumbnails = (input("7. 是否附 NAV 縮圖（需 matplotlib）？(True/False，預設 False)：").strip() or 'False').lower() == 'true'
+    
+    reporter = ReportGenerator(config.reports_dir)
+    reporter.run(summary_path, metric, top_n, top_percent, conditions, export_format, mode=mode, thumbnails=thumbnails)
+
+def run_m4(config):
+    from modules.m4_robustness_analyzer import RobustnessAnalyzer
+
+    print("\n[M4: 穩健度分析模組]")
+    result_dirs = input("1. 請輸入 results 子資料夾（逗號分隔多個，如 results/SMA_CROSS_AAPL_20240608_001）：").strip()
+    n_sims = int(input("2. 每組參數模擬次數（預設 2000）：").strip() or 2000)
+    method = input("3. 模擬方法（block=區塊 bootstrap, shuffle=逐期報酬重抽，預設 block）：").strip().lower() or 'block'
+    block_size = int(input("4. 區塊長度（交易日，預設 20）：").strip() or 20)
+    confidence = float(input("5. 信賴水準（預設 0.95）：").strip() or 0.95)
+    max_workers = input("6. 平行行程數（預設 CPU 核心數）：").strip()
+    max_workers = int(max_workers) if max_workers else None
+
+    analyzer = RobustnessAnalyzer(config)
+    for result_dir in [d.strip() for d in result_dirs.split(',') if d.strip()]:
+        analyzer.run(
+            result_dir,
+            n_sims=n_sims,
+            method=method,
+            block_size=block_size,
+            confidence=confidence,
+            max_workers=max_workers
+        )
+        print(f"已更新 {result_dir}/performance_master.csv")
+
+def run_m5(config):
+    from modules.m5_param_surface import ParamSurfaceAnalyzer
+
+    print("\n[M5: 參數平面分析模組]")
+    summary_path = input("1. 請輸入 summary 檔案路徑（如 results/performance_master.csv）：").strip()
+    metric = input("2. 請輸入分析指標（預設 total_return）：").strip() or 'total_return'
+    radius = int(input("3. 鄰域半徑（格點數，預設 1）：").strip() or 1)
+    strategy = input("4. 僅分析指定策略（可留空）：").strip().upper() or None
+    symbol = input("5. 僅分析指定股票（可留空）：").strip().upper() or None
+    heatmap_axes = input("6. 熱度圖座標軸（如 short_period,long_period，預設前兩個參數）：").strip()
+    heatmap_axes = tuple(a.strip() for a in heatmap_axes.split(',')) if heatmap_axes else None
+
+    analyzer = ParamSurfaceAnalyzer(config)
+    outputs = analyzer.run(summary_path, metric, radius, strategy, symbol, heatmap_axes)
+    print(f"已輸出 {len(outputs)} 個檔案至 {analyzer.reports_dir}")
+
 if __name__ == '__main__':
     main() 
\ No newline at end of file
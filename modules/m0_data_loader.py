@@ -3,22 +3,25 @@ import time
 import random
 import datetime
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import yfinance as yf
 from utils.config import Config
+from utils.logger import get_logger
+from modules.m0_data_sources import DataSource, get_data_source
 from pathlib import Path
-import logging
 
 class DataLoader:
     """
     M0: 歷史資料下載模組
 
     功能:
-      - 從 yfinance 下載股票歷史資料
-      - 支援分段下載、指數退避與重試機制
+      - 透過可替換的資料來源（yfinance、離線模擬 fake）下載股票歷史資料
+      - 支援重播快取，重複的請求直接由磁碟讀取
+      - 支援分段下載、指數退避與重試機制、多股票平行下載
       - 選擇性儲存至 SQLite 資料庫或 Parquet 檔
     """
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, source: DataSource = None):
         self.config = config
         self.setup_logging()
         # 確保資料夾存在
@@ -26,51 +29,53 @@ class DataLoader:
         os.makedirs(self.data_dir, exist_ok=True)
         # 資料庫位置
         self.db_path = config.database.path
+        # 資料來源（未指定時依設定建立）
+        self.source = source or self.create_source(config.data_source)
+        # 下載統計（requests: 請求數, errors: 失敗數, retries: 重試數, rows: 取得筆數）
+        self.stats = {'requests': 0, 'errors': 0, 'retries': 0, 'rows': 0}
+        self._stats_lock = threading.Lock()
 
     def setup_logging(self):
         """設置日誌"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
-        self.logger = logging.getLogger(__name__)
+        self.logger = get_logger(__name__)
+
+    def create_source(self, name: str, **kwargs) -> DataSource:
+        cache_dir = self.config.cache_dir if self.config.use_replay_cache else None
+        return get_data_source(name, cache_dir=cache_dir, **kwargs)
+
+    def count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    @staticmethod
+    def normalize_columns(data: pd.DataFrame) -> pd.DataFrame:
+        """欄位統一為小寫單層（yfinance 新版會回傳 (Price, Ticker) 多層欄位）"""
+        if isinstance(data.columns, pd.MultiIndex):
+            data.columns = data.columns.get_level_values(0)
+        data.columns = [str(c).lower() for c in data.columns]
+        return data
 
     def download_data(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """下載單一股票資料"""
-        try:
-            # 增加隨機延遲，避免同時請求
-            delay = self.config.download_delay + random.uniform(2, 5)
+        """下載單一股票資料，查無資料回傳 None，連線或速率限制錯誤則拋出例外由呼叫端重試"""
+        # 增加隨機延遲，避免同時請求（重播快取命中時不需連線，略過等待）
+        delay = 0.0
+        if self.source.throttled(symbol, start_date, end_date):
+            delay = self.config.download_delay + random.uniform(*self.config.download_jitter)
+        if delay > 0:
             self.logger.info(f"等待 {delay:.1f} 秒後開始下載...")
             time.sleep(delay)
-            
-            # 使用更保守的設定
-            data = yf.download(
-                symbol,
-                start=start_date,
-                end=end_date,
-                progress=False,
-                auto_adjust=True,
-                threads=False,  # 禁用多執行緒以避免速率限制
-                ignore_tz=True  # 忽略時區以避免問題
-            )
-            
-            if data.empty:
-                self.logger.warning(f"{symbol} 無資料")
-                return None
-                
-            return data
-            
-        except Exception as e:
-            self.logger.error(f"下載 {symbol} 時發生錯誤: {str(e)}")
+
+        self.count('requests')
+        data = self.source.fetch(symbol, start_date, end_date)
+        if data is None or data.empty:
+            self.logger.warning(f"{symbol} {start_date} ~ {end_date} 無資料")
             return None
-            
-    def download_stock_data(self, symbols: list, start_date: str, end_date: str):
-        """下載多個股票資料"""
-        # 轉換日期字串為日期物件
+        return self.normalize_columns(data)
+
+    def split_date_range(self, start_date: str, end_date: str) -> list:
+        """依 date_chunk_size 切分下載區間（迄日不含當日，與 yfinance 相同）"""
         start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.datetime.strptime(end_date, "%Y-%m-%d")
-        
-        # 計算需要下載的日期區間
         date_ranges = []
         current_start = start
         while current_start < end:
@@ -82,46 +87,91 @@ class DataLoader:
                 current_start.strftime("%Y-%m-%d"),
                 current_end.strftime("%Y-%m-%d")
             ))
-            current_start = current_end + datetime.timedelta(days=1)
-            
-        # 下載每個股票資料
-        for symbol in symbols:
-            symbol = symbol.strip().upper()
-            self.logger.info(f"下載 {symbol} 資料: {start_date} ~ {end_date}")
-            
-            all_data = []
-            for chunk_start, chunk_end in date_ranges:
-                retry_count = 0
-                while retry_count < self.config.max_retries:
-                    try:
-                        self.logger.info(f"下載區間: {chunk_start} ~ {chunk_end}")
-                        data = self.download_data(symbol, chunk_start, chunk_end)
-                        if data is not None:
-                            all_data.append(data)
-                            self.logger.info(f"成功下載 {len(data)} 筆資料")
-                            break
-                        else:
-                            raise Exception("下載結果為空")
-                    except Exception as e:
-                        retry_count += 1
-                        if retry_count == self.config.max_retries:
-                            self.logger.error(f"{symbol} 下載失敗，已達最大重試次數")
-                            break
-                        # 指數退避重試
-                        wait_time = (2 ** retry_count) + random.uniform(5, 10)
-                        self.logger.warning(f"重試 {symbol} ({retry_count}/{self.config.max_retries})，等待 {wait_time:.1f} 秒")
-                        time.sleep(wait_time)
+            current_start = current_end
+        return date_ranges
+
+    def load_existing(self, symbol: str) -> pd.DataFrame:
+        csv_path = self.config.data_dir / f"{symbol}.csv"
+        if not csv_path.exists():
+            return None
+        return pd.read_csv(csv_path, index_col=0, parse_dates=True)
+
+    def missing_ranges(self, existing: pd.DataFrame, start_date: str, end_date: str) -> list:
+        """auto_fill：只回傳既有資料未涵蓋的前段與後段日期區間"""
+        if existing is None or existing.empty:
+            return [(start_date, end_date)]
+        first = existing.index.min()
+        last = existing.index.max()
+        ranges = []
+        if pd.Timestamp(start_date) < first:
+            ranges.append((start_date, min(first, pd.Timestamp(end_date)).strftime("%Y-%m-%d")))
+        next_day = last + pd.Timedelta(days=1)
+        if next_day < pd.Timestamp(end_date):
+            ranges.append((max(next_day, pd.Timestamp(start_date)).strftime("%Y-%m-%d"), end_date))
+        return ranges
+
+    def download_symbol(self, symbol: str, start_date: str, end_date: str, auto_fill: bool = False):
+        """下載單一股票所有分段並儲存"""
+        symbol = symbol.strip().upper()
+        self.logger.info(f"下載 {symbol} 資料: {start_date} ~ {end_date}")
+
+        existing = self.load_existing(symbol) if auto_fill else None
+        date_ranges = []
+        for range_start, range_end in self.missing_ranges(existing, start_date, end_date):
+            date_ranges.extend(self.split_date_range(range_start, range_end))
+        if not date_ranges:
+            self.logger.info(f"{symbol} 資料已完整，不需下載")
+            return
+
+        all_data = []
+        for chunk_start, chunk_end in date_ranges:
+            retry_count = 0
+            while retry_count < self.config.max_retries:
+                try:
+                    self.logger.info(f"下載區間: {chunk_start} ~ {chunk_end}")
+                    data = self.download_data(symbol, chunk_start, chunk_end)
+                    if data is not None:
+                        all_data.append(data)
+                        self.count('rows', len(data))
+                        self.logger.info(f"成功下載 {len(data)} 筆資料")
+                    break
+                except Exception as e:
+                    self.count('errors')
+                    self.logger.error(f"下載 {symbol} 時發生錯誤: {str(e)}")
+                    retry_count += 1
+                    if retry_count == self.config.max_retries:
+                        self.logger.error(f"{symbol} 下載失敗，已達最大重試次數")
+                        break
+                    self.count('retries')
+                    # 指數退避重試
+                    wait_time = self.config.retry_base ** retry_count + random.uniform(*self.config.retry_jitter)
+                    self.logger.warning(f"重試 {symbol} ({retry_count}/{self.config.max_retries})，等待 {wait_time:.1f} 秒")
+                    time.sleep(wait_time)
+
+        if all_data:
+            # 合併所有資料（auto_fill 時包含既有資料）
+            if existing is not None:
+                all_data.insert(0, self.normalize_columns(existing))
+            final_data = pd.concat(all_data)
+            final_data = final_data[~final_data.index.duplicated(keep='first')]
+            final_data.sort_index(inplace=True)
             
-            if all_data:
-                # 合併所有資料
-                final_data = pd.concat(all_data)
-                final_data = final_data[~final_data.index.duplicated(keep='first')]
-                final_data.sort_index(inplace=True)
-                
-                # 儲存資料
-                self.save_data(symbol, final_data)
-            else:
-                self.logger.warning(f"{symbol} 無資料，跳過儲存。")
+            # 儲存資料
+            self.save_data(symbol, final_data)
+        else:
+            self.logger.warning(f"{symbol} 無資料，跳過儲存。")
+
+    def download_stock_data(self, symbols: list, start_date: str, end_date: str, auto_fill: bool = False, max_workers: int = 1):
+        """下載多個股票資料，max_workers > 1 時多股票平行下載"""
+        symbols = [s for s in symbols if s.strip()]
+        if max_workers <= 1:
+            for symbol in symbols:
+                self.download_symbol(symbol, start_date, end_date, auto_fill)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(self.download_symbol, symbol, start_date, end_date, auto_fill) for symbol in symbols]
+            for future in futures:
+                future.result()
                 
     def save_data(self, symbol: str, data: pd.DataFrame):
         """儲存股票資料"""
@@ -168,9 +218,21 @@ class DataLoader:
         filepath = os.path.join(self.data_dir, f"{symbol}.parquet")
         df.to_parquet(filepath)
 
-    def run(self, symbols: list, start_date: str, end_date: str):
+    def run(self, symbols: list, start_date: str, end_date: str, save_to_db: bool = None, auto_fill: bool = False,
+            source: str = None, max_workers: int = None, download_delay: float = None, date_chunk_size: int = None):
         """
         批次下載多個股票資料，並根據設定儲存
         symbols: List of ticker strings
+        其餘參數未指定時沿用 Config 設定；source 為資料來源名稱（yfinance / fake）
         """
-        self.download_stock_data(symbols, start_date, end_date) 
\ No newline at end of file
+        if save_to_db is not None:
+            self.config.save_to_db = save_to_db
+        if download_delay is not None:
+            self.config.download_delay = download_delay
+        if date_chunk_size is not None:
+            self.config.date_chunk_size = date_chunk_size
+        if source is not None and source.lower() != self.source.name:
+            self.source = self.create_source(source)
+        self.download_stock_data(symbols, start_date, end_date, auto_fill, max_workers or self.config.max_workers)
+        self.logger.info(f"下載統計：{self.stats}")
+        return self.stats
@@ -0,0 +1,200 @@
+import time
+import zlib
+import random
+import threading
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+class DataSourceError(Exception):
+    """資料來源錯誤（連線失敗、速率限制等），由 DataLoader 重試"""
+
+
+class DataSource:
+    """
+    M0 資料來源介面
+
+    子類別實作 fetch()，回傳以日期為 index、含 Open/High/Low/Close/Volume 欄位的 DataFrame；
+    查無資料時回傳 None 或空 DataFrame，連線或速率限制錯誤則拋出例外。
+    """
+    name = 'base'
+
+    def fetch(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def cache_key(self) -> str:
+        """重播快取的子資料夾名稱，參數不同的來源應回傳不同值"""
+        return self.name
+
+    def throttled(self, symbol: str, start_date: str, end_date: str) -> bool:
+        """此請求是否需要連線（DataLoader 只在需要連線時套用下載間隔）"""
+        return True
+
+
+class YFinanceSource(DataSource):
+    """
+    yfinance 資料來源
+
+    yf.download 以模組層級的共用狀態（shared._DFS、shared._ERRORS）存放結果與錯誤，且每次呼叫都會清空，
+    多執行緒同時下載會互相覆蓋，因此以類別層級的鎖逐一下載；平行度仍適用於快取命中與其他來源。
+    """
+    name = 'yfinance'
+    _lock = threading.Lock()
+    # 代表「查詢成功但區間內無資料」的錯誤訊息片段，其餘錯誤皆視為可重試
+    NO_DATA_MESSAGES = ('no price data found', 'no data found for this date range')
+
+    def fetch(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        # yfinance 載入較慢，僅在實際下載時才匯入
+        import yfinance as yf
+
+        with self._lock:
+            # 使用較保守的設定
+            data = yf.download(
+                symbol,
+                start=start_date,
+                end=end_date,
+                progress=False,
+                auto_adjust=True,
+                threads=False,  # 禁用多執行緒以避免速率限制
+                ignore_tz=True  # 忽略時區以避免問題
+            )
+            # yf.download 失敗時不拋出例外，而是記錄於 shared._ERRORS 並回傳空表
+            errors = dict(getattr(getattr(yf, 'shared', None), '_ERRORS', None) or {})
+        error = errors.get(symbol) or errors.get(symbol.upper())
+        if error and (data is None or data.empty):
+            if self.is_no_data(str(error)):
+                return None
+            raise DataSourceError(f"yfinance 下載失敗：{symbol} {start_date} ~ {end_date}：{error}")
+        return data
+
+    @staticmethod
+    def is_no_data(message: str) -> bool:
+        """區間內確實無資料（非連線或速率限制錯誤），不需重試"""
+        message = message.lower()
+        return any(text in message for text in YFinanceSource.NO_DATA_MESSAGES)
+
+
+class FakeSource(DataSource):
+    """
+    離線模擬資料來源
+
+    依股票代碼產生可重現的合成日 K（幾何隨機漫步），可設定每次請求延遲與錯誤率，
+    用於離線測試與量測 DataLoader 的吞吐量、重試與速率限制行為。
+    """
+    name = 'fake'
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def cache_key(self) -> str:
+        return f"{self.name}_{self.seed}"
+
+    def bars(self, symbol: str, dates: pd.DatetimeIndex) -> pd.DataFrame:
+        """產生合成 K 線；同一股票與日期永遠得到相同價格（與請求分段方式無關）"""
+        base = pd.Timestamp('2000-01-03')
+        day = ((dates - base).days).to_numpy()
+        sym_seed = zlib.crc32(symbol.encode('utf-8')) ^ self.seed
+        # 以「股票 + 日期」決定每日報酬，分段下載後合併仍與一次下載相同
+        noise = np.array([np.random.default_rng([sym_seed, int(d)]).standard_normal(4) for d in day]).reshape(-1, 4)
+        drift = 0.0002 * day
+        level = 50 + (sym_seed % 200)
+        close = level * np.exp(drift + 0.1 * np.sin(day / 45.0) + 0.01 * noise[:, 0])
+        open_ = close * (1 + 0.005 * noise[:, 1])
+        high = np.maximum(open_, close) * (1 + 0.005 * np.abs(noise[:, 2]))
+        low = np.minimum(open_, close) * (1 - 0.005 * np.abs(noise[:, 3]))
+        volume = (1_000_000 * (1 + 0.5 * np.abs(noise[:, 1]))).astype(np.int64)
+        return pd.DataFrame(
+            {'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume},
+            index=pd.DatetimeIndex(dates, name='Date')
+        )
+
+    def fetch(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise DataSourceError(f"模擬錯誤（速率限制）：{symbol} {start_date} ~ {end_date}")
+        # 與 yfinance 相同，end_date 不含當日
+        dates = pd.bdate_range(start_date, pd.Timestamp(end_date) - pd.Timedelta(days=1))
+        return self.bars(symbol, dates)
+
+
+class ReplayCacheSource(DataSource):
+    """
+    重播快取
+
+    包裝其他資料來源，將成功的回應以 Parquet 存於磁碟；相同 (股票, 起日, 迄日) 的請求直接讀取快取，
+    不再連線。空結果、錯誤，以及涵蓋今日（交易可能尚未結束）或未來日期的區間不會被快取。
+    """
+    def __init__(self, source: DataSource, cache_dir):
+        self.source = source
+        self.name = source.name
+        self.cache_dir = Path(cache_dir) / source.cache_key()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_final(end_date: str) -> bool:
+        """區間（迄日不含當日）是否只涵蓋已收盤的交易日"""
+        return pd.Timestamp(end_date) <= pd.Timestamp.today().normalize()
+
+    def cache_key(self) -> str:
+        return self.source.cache_key()
+
+    def cache_path(self, symbol: str, start_date: str, end_date: str) -> Path:
+        return self.cache_dir / f"{symbol}_{start_date}_{end_date}.parquet"
+
+    def throttled(self, symbol: str, start_date: str, end_date: str) -> bool:
+        """快取命中時不需連線，也不需等待下載間隔"""
+        if self.cache_path(symbol, start_date, end_date).exists():
+            return False
+        return self.source.throttled(symbol, start_date, end_date)
+
+    def fetch(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        path = self.cache_path(symbol, start_date, end_date)
+        if path.exists():
+            with self._lock:
+                self.hits += 1
+            return pd.read_parquet(path)
+        with self._lock:
+            self.misses += 1
+        data = self.source.fetch(symbol, start_date, end_date)
+        if data is not None and not data.empty and self.is_final(end_date):
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            data.to_parquet(tmp_path)
+            tmp_path.replace(path)
+        return data
+
+
+DATA_SOURCES = {
+    'yfinance': YFinanceSource,
+    'fake': FakeSource,
+}
+
+
+def get_data_source(name: str = 'yfinance', cache_dir=None, **kwargs) -> DataSource:
+    """
+    依名稱建立資料來源
+
+    Args:
+        name: 'yfinance' 或 'fake'
+        cache_dir: 重播快取資料夾，None 則不使用快取
+        kwargs: 傳給資料來源建構子（如 FakeSource 的 latency、error_rate）
+    """
+    name = (name or 'yfinance').lower()
+    if name not in DATA_SOURCES:
+        raise ValueError(f"不支援的資料來源: {name}（可用：{', '.join(DATA_SOURCES)}）")
+    source = DATA_SOURCES[name](**kwargs)
+    if cache_dir is not None:
+        source = ReplayCacheSource(source, cache_dir)
+    return source
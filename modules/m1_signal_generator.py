@@ -1,10 +1,14 @@
 import os
 import json
+import datetime
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import logging
 from utils.config import Config
+from utils.logger import get_logger
+from utils.sweep_manifest import SweepManifest, atomic_write_text
+from utils.signal_store import SignalEventStore
+from utils.dtypes import downcast_prices, downcast_signals, memory_usage_mb
 
 class SignalGenerator:
     """
@@ -16,6 +20,18 @@ class SignalGenerator:
       - 產生交易信號
       - 輸出信號檔案與參數對照表
     """
+    # events 格式每累積多少組參數即寫入一次事件檔（供中斷續跑）
+    EVENT_FLUSH_EVERY = 500
+    # 均線相對差小於此值視為相等（吸收滾動加總的浮點誤差）
+    SMA_TOLERANCE = 1e-9
+    # RSI 計算結果保留的小數位數
+    RSI_DECIMALS = 8
+    # 續跑時須與既有批次相同的設定欄位
+    RESUME_KEYS = ('symbol', 'strategy', 'start_date', 'end_date', 'save_format')
+    # 多股票批次清單的檔名前綴，以及代表「整支股票完成」的 param_id
+    SWEEP_PREFIX = 'sweep_'
+    SWEEP_UNIT = '*'
+
     def __init__(self, config: Config):
         self.config = config
         self.setup_logging()
@@ -28,11 +44,7 @@ class SignalGenerator:
 
     def setup_logging(self):
         """設置日誌"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
-        self.logger = logging.getLogger(__name__)
+        self.logger = get_logger(__name__)
 
     def load_data(self, symbol: str) -> pd.DataFrame:
         """載入股票歷史資料"""
@@ -41,7 +53,8 @@ class SignalGenerator:
             csv_path = self.config.data_dir / f"{symbol}.csv"
             if csv_path.exists():
                 df = pd.read_csv(csv_path, index_col=0, parse_dates=True)
-                self.logger.info(f"從 {csv_path} 載入 {symbol} 資料")
+                df = downcast_prices(df, self.config.price_dtype)
+                self.logger.info(f"從 {csv_path} 載入 {symbol} 資料（{memory_usage_mb(df):.2f} MB）")
                 return df
             else:
                 self.logger.error(f"找不到 {symbol} 的歷史資料檔案")
@@ -56,16 +69,22 @@ class SignalGenerator:
         # 計算移動平均
         df['sma_short'] = df['close'].rolling(window=short_period).mean()
         df['sma_long'] = df['close'].rolling(window=long_period).mean()
+        # 均線差，浮點誤差範圍內視為相等，使完整計算與增量更新的交叉判斷一致
+        diff = self.sma_spread(df['sma_short'], df['sma_long'])
         # 產生信號
         df['signal'] = 0
         # 黃金交叉：短期均線向上穿越長期均線
-        df.loc[(df['sma_short'] > df['sma_long']) & 
-               (df['sma_short'].shift(1) <= df['sma_long'].shift(1)), 'signal'] = 1
+        df.loc[(diff > 0) & (diff.shift(1) <= 0), 'signal'] = 1
         # 死亡交叉：短期均線向下穿越長期均線
-        df.loc[(df['sma_short'] < df['sma_long']) & 
-               (df['sma_short'].shift(1) >= df['sma_long'].shift(1)), 'signal'] = -1
+        df.loc[(diff < 0) & (diff.shift(1) >= 0), 'signal'] = -1
         return df[['signal']]
 
+    @staticmethod
+    def sma_spread(sma_short, sma_long):
+        """短長均線差，相對誤差小於 SMA_TOLERANCE 時視為 0"""
+        diff = sma_short - sma_long
+        return diff.where(abs(diff) > SignalGenerator.SMA_TOLERANCE * abs(sma_long), diff * 0)
+
     def calculate_rsi(self, df: pd.DataFrame, period: int = 14, 
                      overbought: float = 70, oversold: float = 30) -> pd.DataFrame:
         """計算 RSI 策略"""
@@ -77,7 +96,8 @@ class SignalGenerator:
         loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
         # 計算 RS 和 RSI
         rs = gain / loss
-        df['rsi'] = 100 - (100 / (1 + rs))
+        # 四捨五入吸收滾動平均的浮點誤差，使剛好落在門檻上的 RSI 在完整計算與增量更新一致
+        df['rsi'] = (100 - (100 / (1 + rs))).round(self.RSI_DECIMALS)
         # 產生信號
         df['signal'] = 0
         df.loc[df['rsi'] < oversold, 'signal'] = 1  # 超賣買入
@@ -87,9 +107,9 @@ class SignalGenerator:
     def generate_signals(self, df: pd.DataFrame, strategy: str, params: dict) -> pd.DataFrame:
         """根據策略類型產生信號"""
         if strategy == 'SMA_CROSS':
-            return self.calculate_sma(df, params['short_period'], params['long_period'])
+            return downcast_signals(self.calculate_sma(df, params['short_period'], params['long_period']))
         elif strategy == 'RSI':
-            return self.calculate_rsi(df, params['period'], params['overbought'], params['oversold'])
+            return downcast_signals(self.calculate_rsi(df, params['period'], params['overbought'], params['oversold']))
         else:
             self.logger.error(f"不支援的策略類型: {strategy}")
             return None
@@ -108,6 +128,17 @@ class SignalGenerator:
         except Exception as e:
             self.logger.error(f"儲存信號檔案時發生錯誤: {str(e)}")
 
+    def flush_events(self, event_path: Path, dates: pd.DatetimeIndex, events: dict, pending: list, manifest: SweepManifest, symbol: str, strategy: str):
+        """寫入信號事件檔，並將已寫入的參數組合標記為完成"""
+        try:
+            SignalEventStore.write(event_path, dates, events)
+            self.logger.info(f"已儲存信號事件檔: {event_path}（{len(events)} 組參數）")
+            for param_id in pending:
+                manifest.mark_done(symbol, strategy, param_id)
+            pending.clear()
+        except Exception as e:
+            self.logger.error(f"儲存信號事件檔時發生錯誤: {str(e)}")
+
     def save_param_log(self, strategy: str):
         """儲存參數對照表"""
         try:
@@ -126,7 +157,163 @@ class SignalGenerator:
         except Exception as e:
             self.logger.error(f"儲存參數對照表時發生錯誤: {str(e)}")
 
-    def run(self, symbol: str, strategy: str, param_space: list, start_date=None, end_date=None, save_format='csv', export_param_log=True):
+    def state_path(self, strategy: str, symbol: str) -> Path:
+        return self.signals_dir / f"signal_state_{strategy}_{symbol}.json"
+
+    def build_state(self, df: pd.DataFrame, strategy: str, symbol: str, param_space: list, save_format: str) -> dict:
+        """
+        由完整歷史建立增量更新狀態
+
+        所有參數組合共用最近 max_window + 2 筆收盤價，個別參數只保存滾動加總：
+          - SMA_CROSS: 短/長均線的收盤價加總，以及上一根 K 棒的均線值（判斷交叉）
+          - RSI: 最近 period 筆漲幅與跌幅加總（與 calculate_rsi 的簡單移動平均一致）
+        """
+        closes = df['close'].to_numpy(dtype=np.float64)
+        n = len(closes)
+        state = {
+            'strategy': strategy,
+            'symbol': symbol,
+            'save_format': save_format,
+            'last_date': df.index[-1].isoformat(),
+            'n_bars': n,
+            'param_ids': [f"{i:04d}" for i in range(1, len(param_space) + 1)],
+            'params': param_space,
+        }
+        if strategy == 'SMA_CROSS':
+            windows = [p['long_period'] for p in param_space] + [p['short_period'] for p in param_space]
+            state['sum_short'], state['sum_long'], state['prev_short'], state['prev_long'] = [], [], [], []
+            for p in param_space:
+                for key, w in (('short', p['short_period']), ('long', p['long_period'])):
+                    total = float(closes[-min(n, w):].sum())
+                    state[f'sum_{key}'].append(total)
+                    state[f'prev_{key}'].append(total / w if n >= w else None)
+        elif strategy == 'RSI':
+            windows = [p['period'] for p in param_space]
+            delta = np.diff(closes, prepend=np.nan)
+            gains = np.where(delta > 0, delta, 0.0)
+            losses = np.where(delta < 0, -delta, 0.0)
+            state['sum_gain'] = [float(gains[-min(n, p['period']):].sum()) for p in param_space]
+            state['sum_loss'] = [float(losses[-min(n, p['period']):].sum()) for p in param_space]
+        else:
+            raise ValueError(f"不支援增量更新的策略類型: {strategy}")
+        state['history_size'] = max(windows, default=1) + 2
+        state['closes'] = closes[-state['history_size']:].tolist()
+        return state
+
+    def step_state(self, state: dict, close: float) -> np.ndarray:
+        """以一根新 K 棒更新狀態，回傳所有參數組合的新信號（向量化，O(params)）"""
+        history = np.append(np.asarray(state['closes'], dtype=np.float64), close)
+        n = state['n_bars'] + 1
+        params = state['params']
+        signal = np.zeros(len(params), dtype=np.int8)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if state['strategy'] == 'SMA_CROSS':
+                sma = {}
+                for key in ('short', 'long'):
+                    w = np.array([p[f'{key}_period'] for p in params])
+                    # 移出視窗的收盤價：history[-w-1]，未滿視窗時不移出
+                    dropped = np.where(n > w, history[np.maximum(len(history) - w - 1, 0)], 0.0)
+                    total = np.asarray(state[f'sum_{key}'], dtype=np.float64) + close - dropped
+                    state[f'sum_{key}'] = total.tolist()
+                    sma[key] = np.where(n >= w, total / w, np.nan)
+                diff = self.sma_spread(pd.Series(sma['short']), pd.Series(sma['long'])).to_numpy()
+                prev_diff = self.sma_spread(pd.Series(state['prev_short'], dtype=np.float64),
+                                            pd.Series(state['prev_long'], dtype=np.float64)).to_numpy()
+                signal[(diff > 0) & (prev_diff <= 0)] = 1
+                signal[(diff < 0) & (prev_diff >= 0)] = -1
+                state['prev_short'] = [None if np.isnan(v) else float(v) for v in sma['short']]
+                state['prev_long'] = [None if np.isnan(v) else float(v) for v in sma['long']]
+            else:
+                period = np.array([p['period'] for p in params])
+                delta = close - history[-2] if len(history) > 1 else 0.0
+                # 移出視窗的漲跌幅：第 n-1-period 根 K 棒的變化，第 0 根視為 0
+                drop_idx = np.maximum(len(history) - period - 1, 1)
+                dropped_delta = np.where(n - 1 - period >= 1, history[drop_idx] - history[drop_idx - 1], 0.0)
+                dropped_delta = np.where(n > period, dropped_delta, 0.0)
+                sum_gain = np.asarray(state['sum_gain'], dtype=np.float64) + max(delta, 0.0) - np.maximum(dropped_delta, 0.0)
+                sum_loss = np.asarray(state['sum_loss'], dtype=np.float64) + max(-delta, 0.0) - np.maximum(-dropped_delta, 0.0)
+                # 消除累加誤差，避免平盤時 0/0 被算成極端值
+                scale = np.abs(history).max() * 1e-12
+                sum_gain[np.abs(sum_gain) < scale] = 0.0
+                sum_loss[np.abs(sum_loss) < scale] = 0.0
+                state['sum_gain'] = sum_gain.tolist()
+                state['sum_loss'] = sum_loss.tolist()
+                rsi = np.where(n >= period, 100 - 100 / (1 + sum_gain / sum_loss), np.nan).round(self.RSI_DECIMALS)
+                signal[rsi < np.array([p['oversold'] for p in params])] = 1
+                signal[rsi > np.array([p['overbought'] for p in params])] = -1
+        state['closes'] = history[-state['history_size']:].tolist()
+        state['n_bars'] = n
+        return signal
+
+    def save_state(self, state: dict):
+        path = self.state_path(state['strategy'], state['symbol'])
+        atomic_write_text(path, json.dumps(state, ensure_ascii=False))
+        self.logger.info(f"已儲存增量更新狀態: {path}")
+
+    def load_state(self, strategy: str, symbol: str) -> dict:
+        path = self.state_path(strategy, symbol)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def update(self, symbol: str, strategy: str):
+        """
+        增量更新：只計算 M0 新增的 K 棒，並附加至既有信號檔
+
+        需先以 run() 產生該批次信號（會同時輸出 signal_state_<策略>_<股票>.json）。
+        每根新 K 棒的計算量為 O(參數組數)，不需重算完整歷史。
+        """
+        state = self.load_state(strategy, symbol)
+        if state is None:
+            self.logger.error(f"{self.signals_dir} 找不到 {strategy}_{symbol} 的增量更新狀態，請先執行完整信號產生")
+            return
+        df = self.load_data(symbol)
+        if df is None:
+            return
+        new_bars = df[df.index > pd.Timestamp(state['last_date'])]
+        if new_bars.empty:
+            self.logger.info(f"{symbol} 無新資料，信號已是最新")
+            return
+
+        save_format = state['save_format']
+        rows = []
+        for date, close in new_bars['close'].items():
+            rows.append((date, self.step_state(state, float(close))))
+
+        if save_format == 'csv':
+            for i, param_id in enumerate(state['param_ids']):
+                signal_path = self.signals_dir / f"{strategy}_{symbol}_{param_id}.csv"
+                with open(signal_path, 'a', encoding='utf-8') as f:
+                    for date, signal in rows:
+                        f.write(f"{date.strftime('%Y-%m-%d') if date == date.normalize() else date.isoformat()},{signal[i]}\n")
+        elif save_format == 'events':
+            event_path = self.signals_dir / SignalEventStore.filename(strategy, symbol)
+            store = SignalEventStore(event_path)
+            dates = store.dates.append(pd.DatetimeIndex([date for date, _ in rows]))
+            events = store.events()
+            start = len(store.dates)
+            for i, param_id in enumerate(state['param_ids']):
+                idx, values = events.get(param_id, (np.array([], dtype=np.int32), np.array([], dtype=np.int8)))
+                last = values[-1] if len(values) else 0
+                new_idx, new_values = [], []
+                for j, (_, signal) in enumerate(rows):
+                    if signal[i] != last:
+                        new_idx.append(start + j)
+                        new_values.append(signal[i])
+                        last = signal[i]
+                events[param_id] = (np.concatenate([idx, np.array(new_idx, dtype=np.int32)]),
+                                    np.concatenate([values, np.array(new_values, dtype=np.int8)]))
+            SignalEventStore.write(event_path, dates, events)
+        else:
+            self.logger.error(f"增量更新不支援的儲存格式: {save_format}")
+            return
+
+        state['last_date'] = new_bars.index[-1].isoformat()
+        self.save_state(state)
+        self.logger.info(f"完成 {symbol} 的 {strategy} 增量更新：{len(rows)} 根 K 棒 × {len(state['param_ids'])} 組參數")
+
+    def run(self, symbol: str, strategy: str, param_space: list, start_date=None, end_date=None, save_format='csv', export_param_log=True, resume=False, save_state=True):
         """
         執行信號產生流程
         
@@ -136,10 +323,39 @@ class SignalGenerator:
             param_space: 參數組合列表
             start_date: 資料起始日 (YYYY-MM-DD)
             end_date: 資料結束日 (YYYY-MM-DD)
-            save_format: signals 輸出格式 ('csv' 或 'parquet')
+            save_format: signals 輸出格式 ('csv'、'parquet' 或 'events')
+                'events' 僅記錄信號改變事件，所有參數合併存於單一檔案
             export_param_log: 是否匯出 param_log.json
+            resume: 是否依 sweep_manifest 略過已完成的參數組合（續跑中斷批次），
+                僅在既有批次的股票、策略、日期區間與格式皆相同時生效
+            save_state: 是否輸出增量更新狀態，供 update() 只計算新 K 棒
+
+        Returns:
+            完成時回傳 True，找不到資料時回傳 None
         """
         self.logger.info(f"開始產生 {symbol} 的 {strategy} 策略信號")
+
+        # 批次進度清單：續跑時沿用首次記錄的參數組合，確保 param_id 對應不變
+        meta = {
+            'symbol': symbol,
+            'strategy': strategy,
+            'param_space': param_space,
+            'start_date': start_date,
+            'end_date': end_date,
+            'save_format': save_format
+        }
+        manifest = SweepManifest(self.signals_dir)
+        if resume and manifest.matches(meta, self.RESUME_KEYS) and manifest.meta.get('param_space'):
+            param_space = manifest.meta['param_space']
+            self.logger.info(f"續跑批次，已完成 {len(manifest.completed)}/{len(param_space)} 組")
+        elif manifest.meta:
+            if resume:
+                self.logger.warning(f"{self.signals_dir} 的既有批次設定與本次不同（{manifest.meta.get('strategy')} {manifest.meta.get('symbol')}），改為建立新批次")
+            resume = False
+            manifest.reset(meta)
+        else:
+            resume = False
+            manifest.set_meta(meta)
         
         # 載入歷史資料
         df = self.load_data(symbol)
@@ -154,15 +370,39 @@ class SignalGenerator:
         if df.empty:
             self.logger.error(f"{symbol} 在指定日期範圍內無資料")
             return
+
+        # events 格式：所有參數的信號事件累積後寫入單一檔案
+        if save_format == 'events':
+            event_path = self.signals_dir / SignalEventStore.filename(strategy, symbol)
+            events = SignalEventStore(event_path).events() if resume and event_path.exists() else {}
+            pending = []
         
         # 產生每組參數的信號
         for i, params in enumerate(param_space, start=1):
             param_id = f"{i:04d}"
             self.signal_param_map[param_id] = params
+
+            if resume and manifest.is_done(symbol, strategy, param_id):
+                self.param_log[param_id] = {
+                    'strategy': strategy,
+                    'symbol': symbol,
+                    'params': params
+                }
+                continue
             
             # 產生信號
             signals = self.generate_signals(df, strategy, params)
-            if signals is not None:
+            if signals is not None and save_format == 'events':
+                events[param_id] = SignalEventStore.encode(signals['signal'].to_numpy())
+                pending.append(param_id)
+                self.param_log[param_id] = {
+                    'strategy': strategy,
+                    'symbol': symbol,
+                    'params': params
+                }
+                if len(pending) >= self.EVENT_FLUSH_EVERY:
+                    self.flush_events(event_path, df.index, events, pending, manifest, symbol, strategy)
+            elif signals is not None:
                 # 儲存信號
                 signal_path = self.signals_dir / f"{strategy}_{symbol}_{param_id}.{save_format}"
                 try:
@@ -174,6 +414,7 @@ class SignalGenerator:
                         self.logger.error(f"不支援的儲存格式: {save_format}")
                         continue
                     self.logger.info(f"已儲存信號檔案: {signal_path}")
+                    manifest.mark_done(symbol, strategy, param_id)
                 except Exception as e:
                     self.logger.error(f"儲存信號檔案時發生錯誤: {str(e)}")
                 # 更新參數對照表
@@ -182,6 +423,9 @@ class SignalGenerator:
                     'symbol': symbol,
                     'params': self.signal_param_map[param_id]
                 }
+        if save_format == 'events' and pending:
+            self.flush_events(event_path, df.index, events, pending, manifest, symbol, strategy)
+        manifest.compact()
         # 儲存參數對照表
         if export_param_log:
             try:
@@ -195,4 +439,85 @@ class SignalGenerator:
                 self.logger.info(f"已儲存信號-參數對應表: {signal_param_path}")
             except Exception as e:
                 self.logger.error(f"儲存參數對照表時發生錯誤: {str(e)}")
-        self.logger.info(f"完成 {symbol} 的 {strategy} 策略信號產生") 
\ No newline at end of file
+        if save_state and save_format in ('csv', 'events') and strategy in ('SMA_CROSS', 'RSI'):
+            try:
+                self.save_state(self.build_state(df, strategy, symbol, param_space, save_format))
+            except Exception as e:
+                self.logger.error(f"儲存增量更新狀態時發生錯誤: {str(e)}")
+        self.logger.info(f"完成 {symbol} 的 {strategy} 策略信號產生")
+        return True
+
+    @classmethod
+    def sweep_filename(cls, sweep_id: str) -> str:
+        return f"{cls.SWEEP_PREFIX}{sweep_id}.jsonl"
+
+    @classmethod
+    def pending_sweeps(cls, signals_dir) -> list:
+        """列出 signals 資料夾中尚未完成的多股票批次（sweep_id）"""
+        pending = []
+        for path in sorted(Path(signals_dir).glob(f"{cls.SWEEP_PREFIX}*.jsonl")):
+            manifest = SweepManifest(path.parent, path.name)
+            meta = manifest.meta
+            if meta.get('sweep_id') and not all(manifest.is_done(s, meta['strategy'], cls.SWEEP_UNIT) for s in meta['symbols']):
+                pending.append(meta['sweep_id'])
+        return pending
+
+    def run_sweep(self, symbols: list = None, strategy: str = None, param_space: list = None, start_date=None, end_date=None,
+                  save_format='csv', export_param_log=True, sweep_id: str = None) -> list:
+        """
+        執行多股票信號產生批次
+
+        開始前先於 signals 資料夾寫入批次清單 sweep_<sweep_id>.jsonl（股票列表、策略、日期區間、格式、
+        參數組合與時間戳記），每完成一支股票記錄一筆。指定既有 sweep_id 時依清單續跑：略過已完成的股票、
+        從中斷的股票未完成的參數繼續，並以相同參數組合產生尚未開始的股票。
+
+        Returns:
+            各股票的 signals 子資料夾
+        """
+        manifest = SweepManifest(self.signals_dir, self.sweep_filename(sweep_id)) if sweep_id else None
+        if manifest is not None and manifest.meta:
+            meta = manifest.meta
+            self.logger.info(f"續跑批次 {sweep_id}：已完成 {len(manifest.completed)}/{len(meta['symbols'])} 支股票")
+        else:
+            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            sweep_id = sweep_id or f"{strategy}_{timestamp}"
+            meta = {
+                'sweep_id': sweep_id,
+                'timestamp': timestamp,
+                'symbols': symbols,
+                'strategy': strategy,
+                'param_space': param_space,
+                'start_date': start_date,
+                'end_date': end_date,
+                'save_format': save_format,
+                'export_param_log': export_param_log
+            }
+            manifest = SweepManifest(self.signals_dir, self.sweep_filename(sweep_id))
+            manifest.set_meta(meta)
+
+        strategy = meta['strategy']
+        subdirs = []
+        for symbol in meta['symbols']:
+            subdir = self.signals_dir / f"{strategy}_{symbol}_{meta['timestamp']}"
+            subdirs.append(subdir)
+            if manifest.is_done(symbol, strategy, self.SWEEP_UNIT):
+                continue
+            os.makedirs(subdir, exist_ok=True)
+            generator = SignalGenerator(self.config)
+            generator.signals_dir = subdir  # 指定本次 signal 子資料夾
+            done = generator.run(
+                symbol=symbol,
+                strategy=strategy,
+                param_space=meta['param_space'],
+                start_date=meta['start_date'],
+                end_date=meta['end_date'],
+                save_format=meta['save_format'],
+                export_param_log=meta['export_param_log'],
+                resume=True
+            )
+            if done:
+                manifest.mark_done(symbol, strategy, self.SWEEP_UNIT)
+            else:
+                self.logger.warning(f"{symbol} 未完成信號產生，續跑批次 {meta['sweep_id']} 時會重試")
+        manifest.compact()
+        return subdirs 
\ No newline at end of file
@@ -2,34 +2,58 @@ import os
 import json
 import pandas as pd
 from pathlib import Path
-import logging
 from utils.config import Config
+from utils.logger import get_logger
+from utils.sweep_manifest import SweepManifest, atomic_write_csv
+from utils.signal_store import SignalEventStore
+from utils.dtypes import downcast_prices, downcast_signals, memory_usage_mb
 
 class Backtester:
     """
     M2: 策略回測與績效分析模組
     功能:
-      - 載入 signal CSV
+      - 載入 signal CSV 或信號事件檔（events 格式）
       - 根據信號進行模擬交易
       - 計算績效指標與 NAV
       - 自動 append 至 performance_master.csv
+      - 以 sweep_manifest 記錄已完成的回測，中斷後可續跑（回測設定或輸入檔案改變時自動重跑）
     """
+    # performance_master 中用來識別同一筆回測的欄位
+    MASTER_KEY_COLS = ['sweep_id', 'strategy', 'symbol', 'param_id']
     def __init__(self, config: Config):
         self.config = config
         self.results_dir = config.results_dir
         os.makedirs(self.results_dir, exist_ok=True)
-        self.logger = logging.getLogger(__name__)
+        self.logger = get_logger(__name__)
+        # 各 results 子資料夾的進度清單快取，避免每筆回測重讀
+        self.manifests = {}
+        # 信號事件檔快取，同一檔案的所有參數組合只讀取一次
+        self.event_stores = {}
+        # 價格資料快取，同一股票的多組參數回測只讀取一次
+        self.prices = {}
 
-    def load_signals(self, signal_path: str) -> pd.DataFrame:
-        return pd.read_csv(signal_path, index_col=0, parse_dates=True)
+    def get_event_store(self, signal_path: str) -> SignalEventStore:
+        key = Path(signal_path).resolve()
+        if key not in self.event_stores:
+            self.event_stores[key] = SignalEventStore(signal_path)
+        return self.event_stores[key]
+
+    def load_signals(self, signal_path: str, param_id: str = None) -> pd.DataFrame:
+        if SignalEventStore.is_event_file(signal_path):
+            return self.get_event_store(signal_path).expand(param_id)
+        return downcast_signals(pd.read_csv(signal_path, index_col=0, parse_dates=True))
 
     def load_price(self, symbol: str) -> pd.DataFrame:
-        price_path = self.config.data_dir / f"{symbol}.csv"
-        return pd.read_csv(price_path, index_col=0, parse_dates=True)
+        if symbol not in self.prices:
+            price_path = self.config.data_dir / f"{symbol}.csv"
+            price = downcast_prices(pd.read_csv(price_path, index_col=0, parse_dates=True), self.config.price_dtype)
+            self.logger.info(f"載入 {symbol} 價格資料（{memory_usage_mb(price):.2f} MB）")
+            self.prices[symbol] = price
+        return self.prices[symbol]
 
     def run_backtest(self, price: pd.DataFrame, signals: pd.DataFrame, initial_cash: float, fee: float, slippage: float, position: str, trade_time: str) -> (pd.DataFrame, dict):
         nav = []
-        cash = initial_cash
+        cash = float(initial_cash)
         position_size = 0
         last_signal = 0
         nav_series = []
@@ -37,7 +61,8 @@ class Backtester:
         for date, row in signals.iterrows():
             if date not in price.index:
                 continue
-            close = price.loc[date, 'close']
+            # 價格可能以 float32 儲存，帳務（現金、NAV）一律以 Python float（float64）計算
+            close = float(price.loc[date, 'close'])
             signal = row['signal']
             # 只在信號變化時交易
             if signal != last_signal:
@@ -77,11 +102,15 @@ class Backtester:
         perf['run_id'] = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
         return perf
 
-    def get_param_info(self, signal_file: str):
+    def get_param_info(self, signal_file: str, param_id: str = None):
         # 解析 <策略名稱>_<股票代碼>_<參數編號>.csv，允許策略名稱有多個 _
         basename = os.path.basename(signal_file).replace('.csv', '')
         parts = basename.split('_')
-        if len(parts) >= 3:
+        if SignalEventStore.is_event_file(signal_file):
+            # 信號事件檔：signal_events_<策略名稱>_<股票代碼>.parquet，param_id 由呼叫端指定
+            strategy, symbol = SignalEventStore.parse_name(signal_file)
+            param_id = str(param_id).zfill(4)
+        elif len(parts) >= 3:
             strategy = '_'.join(parts[:-2])
             symbol = parts[-2]
             param_id = parts[-1].zfill(4)  # 統一四位數
@@ -104,11 +133,49 @@ class Backtester:
             params = {}
         return strategy, symbol, param_id, params
 
+    def get_result_dir(self, signal_file: str) -> Path:
+        """直接用信號檔案上層資料夾名稱作為 results 子資料夾"""
+        return self.results_dir / Path(signal_file).parent.name
+
+    def get_manifest(self, result_dir: Path) -> SweepManifest:
+        if result_dir not in self.manifests:
+            self.manifests[result_dir] = SweepManifest(result_dir)
+        return self.manifests[result_dir]
+
+    @staticmethod
+    def file_signature(path) -> list:
+        """檔案大小與修改時間，檔案不存在時回傳 None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def run_fingerprint(self, signal_file: str, symbol: str, settings: dict) -> str:
+        """回測設定與輸入檔案（信號、價格）的指紋，任一改變即需重跑"""
+        return SweepManifest.fingerprint(
+            settings,
+            self.file_signature(signal_file),
+            self.file_signature(self.config.data_dir / f"{symbol}.csv"),
+        )
+
+    def append_master(self, master_path: Path, row: dict):
+        """將單筆績效加入 performance_master，先移除同一回測的舊紀錄再原子寫回"""
+        if master_path.exists():
+            master = pd.read_csv(master_path, dtype={'param_id': str})
+        else:
+            master = pd.DataFrame()
+        key_cols = [c for c in self.MASTER_KEY_COLS if c in master.columns]
+        if not master.empty and len(key_cols) == len(self.MASTER_KEY_COLS):
+            same = pd.Series(True, index=master.index)
+            for col in key_cols:
+                same &= master[col].astype(str) == str(row[col])
+            master = master[~same]
+        master = pd.concat([master, pd.DataFrame([row])], ignore_index=True)
+        atomic_write_csv(master, master_path)
+
     def save(self, perf: dict, nav: pd.DataFrame, strategy: str, run_id: str, export_perf: bool, export_nav: bool, symbol: str, param_id: str, params: dict):
-        # 直接用信號檔案上層資料夾名稱作為 results 子資料夾
-        signal_dir = Path(self.current_signal_file).parent
-        subdir_name = signal_dir.name
-        subdir = self.results_dir / subdir_name
+        subdir = self.get_result_dir(self.current_signal_file)
         os.makedirs(subdir, exist_ok=True)
         
         # 增加策略、股票、參數資訊
@@ -117,6 +184,7 @@ class Backtester:
         perf_full['symbol'] = symbol
         perf_full['param_id'] = param_id
         perf_full['params'] = json.dumps(params, ensure_ascii=False)
+        perf_full['sweep_id'] = subdir.name
         
         if export_perf:
             perf_path = subdir / f"performance_{strategy}_{symbol}_{param_id}.csv"
@@ -127,31 +195,39 @@ class Backtester:
             nav.to_parquet(nav_path)
         
         # 在子資料夾中維護獨立的 performance_master.csv
-        master_path = subdir / "performance_master.csv"
-        if master_path.exists():
-            master = pd.read_csv(master_path)
-        else:
-            master = pd.DataFrame()
-        master = pd.concat([master, pd.DataFrame([perf_full])], ignore_index=True)
-        master.to_csv(master_path, index=False)
+        self.append_master(subdir / "performance_master.csv", perf_full)
         
         # 同時更新根目錄的 performance_master.csv
-        root_master_path = self.results_dir / "performance_master.csv"
-        if root_master_path.exists():
-            root_master = pd.read_csv(root_master_path)
-        else:
-            root_master = pd.DataFrame()
-        root_master = pd.concat([root_master, pd.DataFrame([perf_full])], ignore_index=True)
-        root_master.to_csv(root_master_path, index=False)
+        self.append_master(self.results_dir / "performance_master.csv", perf_full)
 
-    def run(self, signal_file: str, symbol: str, initial_cash: float = 100000, fee: float = 0.001425, slippage: float = 0.0005, position: str = 'fixed=100', trade_time: str = 'next_open', export_perf: bool = True, export_nav: bool = True):
+    def run(self, signal_file: str, symbol: str, initial_cash: float = 100000, fee: float = 0.001425, slippage: float = 0.0005, position: str = 'fixed=100', trade_time: str = 'next_open', export_perf: bool = True, export_nav: bool = True, resume: bool = True, param_id: str = None):
         # 儲存當前信號檔案路徑
         self.current_signal_file = signal_file
         
-        signals = self.load_signals(signal_file)
+        strategy, symbol_from_file, param_id, params = self.get_param_info(signal_file, param_id)
+        manifest = self.get_manifest(self.get_result_dir(signal_file))
+        # 回測設定或信號、價格檔案改變時指紋不同，不會被視為已完成
+        fingerprint = self.run_fingerprint(signal_file, symbol, {
+            'initial_cash': initial_cash,
+            'fee': fee,
+            'slippage': slippage,
+            'position': position,
+            'trade_time': trade_time,
+        })
+        if resume and manifest.is_done(symbol_from_file, strategy, param_id, fingerprint):
+            self.logger.info(f"略過已完成的回測：{signal_file} ({param_id})")
+            return
+
+        signals = self.load_signals(signal_file, param_id)
         price = self.load_price(symbol)
         nav, perf = self.run_backtest(price, signals, initial_cash, fee, slippage, position, trade_time)
-        strategy, symbol_from_file, param_id, params = self.get_param_info(signal_file)
         run_id = perf['run_id']
         self.save(perf, nav, strategy, run_id, export_perf, export_nav, symbol_from_file, param_id, params)
-        self.logger.info(f"完成回測：{signal_file}，績效：{perf}") 
\ No newline at end of file
+        manifest.mark_done(symbol_from_file, strategy, param_id, fingerprint)
+        self.logger.info(f"完成回測：{signal_file} ({param_id})，績效：{perf}")
+
+    def run_events(self, event_file: str, symbol: str, **kwargs):
+        """對信號事件檔中的每組參數依序回測，其餘參數同 run()"""
+        for param_id in self.get_event_store(event_file).param_ids():
+            self.run(event_file, symbol, param_id=param_id, **kwargs)
+        self.get_manifest(self.get_result_dir(event_file)).compact() 
\ No newline at end of file
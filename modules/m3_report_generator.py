@@ -1,6 +1,10 @@
 import os
+import json
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from pathlib import Path
+from utils.dtypes import categorize_results, memory_usage_mb
+from modules.m3_report_writers import open_writers, write_chunks, close_writers, render_nav_thumbnail
 
 class ReportGenerator:
     """
@@ -8,14 +12,19 @@ class ReportGenerator:
     功能:
       - 根據 performance_master.csv 進行排序與篩選
       - 支援 Top N/Top %、條件式篩選
-      - 輸出 CSV / XLSX / HTML
+      - 以串流方式輸出 CSV / XLSX / HTML
+      - 報告包模式：一次輸出所有格式與各股票報告，可附 NAV 縮圖
+      - 跨股票排名模式：各股票/各策略 Top 與參數跨股票穩定度
     """
+    FORMATS = ('csv', 'xlsx', 'html')
     def __init__(self, reports_dir: Path):
         self.reports_dir = Path(reports_dir)
         os.makedirs(self.reports_dir, exist_ok=True)
 
     def load_summary(self, summary_path: str) -> pd.DataFrame:
-        df = pd.read_csv(summary_path)
+        df = pd.read_csv(summary_path, dtype={'param_id': str})
+        df = categorize_results(df)
+        print(f"已載入 {len(df)} 筆績效資料（{memory_usage_mb(df):.2f} MB）")
         # 確保顯示所有關鍵欄位
         show_cols = ['strategy', 'symbol', 'param_id', 'params', 'total_return', 'max_drawdown', 'run_id']
         show_cols = [c for c in show_cols if c in df.columns]
@@ -65,20 +74,158 @@ class ReportGenerator:
         return df
 
     def save_reports(self, df: pd.DataFrame, prefix: str, metric: str, export_format: str, symbol: str):
-        # 使用指定的股票代碼
-        csv_path = self.reports_dir / f"{prefix}_{symbol}_{metric}.csv"
-        xlsx_path = self.reports_dir / f"{prefix}_{symbol}_{metric}.xlsx"
-        html_path = self.reports_dir / f"{prefix}_{symbol}_{metric}.html"
-        if export_format == 'csv':
-            df.to_csv(csv_path, index=False)
-        elif export_format == 'xlsx':
-            df.to_excel(xlsx_path, index=False)
-        elif export_format == 'html':
-            df.to_html(html_path, index=False)
-
-    def run(self, summary_path: str, metric: str, top_n: int = None, top_percent: float = None, conditions: str = '', export_format: str = 'csv', symbol: str = None):
+        # 使用指定的股票代碼；export_format 為 'all' 時一次輸出所有格式
+        formats = self.FORMATS if export_format == 'all' else [export_format]
+        formats = [f for f in formats if f in self.FORMATS]
+        writers = open_writers(self.reports_dir / f"{prefix}_{symbol}_{metric}", formats)
+        try:
+            write_chunks(writers, df)
+        finally:
+            close_writers(writers)
+
+    def top_by_group(self, df: pd.DataFrame, metric: str, group_cols: list, top_n: int = None, top_percent: float = None) -> pd.DataFrame:
+        """各群組（如股票、策略）分別取 Top N / Top %（單次排序 + groupby，不逐一篩選）"""
+        df_sorted = df.sort_values(group_cols + [metric], ascending=[True] * len(group_cols) + [False])
+        groups = df_sorted.groupby(group_cols, observed=True, sort=False)
+        rank = groups.cumcount()
+        if top_n is not None:
+            return df_sorted[rank < top_n]
+        if top_percent is not None:
+            size = groups[metric].transform('size')
+            limit = (size * top_percent / 100).astype(int).clip(lower=1)
+            return df_sorted[rank < limit]
+        return df_sorted
+
+    @staticmethod
+    def param_key(params: pd.Series) -> pd.Series:
+        """將 params JSON 正規化（排序鍵值），作為跨股票辨識同一組參數的鍵"""
+        def normalize(text):
+            try:
+                return json.dumps(json.loads(text), sort_keys=True, ensure_ascii=False)
+            except (TypeError, ValueError):
+                return str(text)
+        params = params.astype(str)
+        mapping = {v: normalize(v) for v in params.unique()}
+        return params.map(mapping)
+
+    def rank_across_symbols(self, df: pd.DataFrame, metric: str, top_n: int = None, top_percent: float = None) -> dict:
+        """
+        跨股票分組排名（單次 groupby）
+
+        Returns:
+            by_symbol: 各股票 Top N / Top %
+            by_strategy: 各策略（跨所有股票）Top N / Top %
+            stability: 每組參數在各股票的排名分布，依中位數百分位排名排序
+                       （rank_pct 為股票內名次 / 該股票參數組數，越小越好）
+        """
+        df = df.copy()
+        df['param_key'] = self.param_key(df['params']) if 'params' in df.columns else df['param_id'].astype(str)
+        within = df.groupby(['strategy', 'symbol'], observed=True)[metric]
+        df['rank'] = within.rank(ascending=False, method='min')
+        df['rank_pct'] = df['rank'] / within.transform('size')
+
+        by_symbol = self.top_by_group(df, metric, ['symbol'], top_n, top_percent)
+        by_strategy = self.top_by_group(df, metric, ['strategy'], top_n, top_percent)
+        stability = (
+            df.groupby(['strategy', 'param_key'], observed=True)
+              .agg(n_symbols=('symbol', 'nunique'),
+                   median_rank=('rank', 'median'),
+                   median_rank_pct=('rank_pct', 'median'),
+                   worst_rank_pct=('rank_pct', 'max'),
+                   **{f'median_{metric}': (metric, 'median'), f'min_{metric}': (metric, 'min')})
+              .reset_index()
+              .rename(columns={'param_key': 'params'})
+              .sort_values(['median_rank_pct', 'n_symbols'], ascending=[True, False])
+        )
+        return {'by_symbol': by_symbol, 'by_strategy': by_strategy, 'stability': stability}
+
+    def find_nav_file(self, summary_path: str, row) -> Path:
+        """依績效列找出對應的 NAV 檔（results/<sweep_id>/ 或 results/ 根目錄）"""
+        results_dir = Path(summary_path).parent
+        name = f"nav_{row.strategy}_{row.symbol}_{row.param_id}.parquet"
+        sweep_id = getattr(row, 'sweep_id', None)
+        candidates = [results_dir / str(sweep_id) / name] if isinstance(sweep_id, str) else []
+        candidates.append(results_dir / name)
+        for path in candidates:
+            if path.exists():
+                return path
+        return None
+
+    def render_thumbnails(self, df: pd.DataFrame, summary_path: str, max_workers: int = None) -> pd.Series:
+        """以多行程平行繪製 NAV 縮圖，回傳相對於報告資料夾的圖檔路徑"""
+        thumbs_dir = self.reports_dir / "thumbs"
+        os.makedirs(thumbs_dir, exist_ok=True)
+        tasks, index = [], []
+        for idx, row in zip(df.index, df.itertuples(index=False)):
+            nav_path = self.find_nav_file(summary_path, row)
+            if nav_path is None:
+                continue
+            sweep = getattr(row, 'sweep_id', None)
+            png = thumbs_dir / f"{sweep + '_' if isinstance(sweep, str) else ''}{row.strategy}_{row.symbol}_{row.param_id}.png"
+            tasks.append((str(nav_path), str(png)))
+            index.append(idx)
+        thumbs = pd.Series(None, index=df.index, dtype=object)
+        if not tasks:
+            return thumbs
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for idx, png in zip(index, pool.map(render_nav_thumbnail, tasks, chunksize=8)):
+                if png is not None:
+                    thumbs[idx] = os.path.relpath(png, self.reports_dir)
+        if thumbs.isna().all():
+            print("無法產生 NAV 縮圖（需要 matplotlib），略過。")
+        return thumbs
+
+    def save_bundle(self, df: pd.DataFrame, prefix: str, metric: str, formats=None,
+                    summary_path: str = None, thumbnails: bool = False, max_workers: int = None):
+        """
+        報告包：單次走訪資料，同時輸出總表與各股票報告的所有格式
+
+        df 需已依 symbol 排序（如 top_by_symbol 的結果），各股票以 groupby 一次切分，不重複篩選。
+        """
+        formats = [f for f in (formats or self.FORMATS) if f in self.FORMATS]
+        image_columns = ()
+        if thumbnails and summary_path:
+            thumbs = self.render_thumbnails(df, summary_path, max_workers)
+            if thumbs.notna().any():
+                df = df.assign(nav_thumbnail=thumbs)
+                image_columns = ('nav_thumbnail',)
+        combined = open_writers(self.reports_dir / f"{prefix}_ALL_{metric}", formats, image_columns)
+        try:
+            for symbol, group in df.groupby('symbol', observed=True, sort=False):
+                writers = open_writers(self.reports_dir / f"{prefix}_{symbol}_{metric}", formats, image_columns)
+                try:
+                    write_chunks(writers + combined, group)
+                finally:
+                    close_writers(writers)
+        finally:
+            close_writers(combined)
+
+    def run(self, summary_path: str, metric: str, top_n: int = None, top_percent: float = None, conditions: str = '', export_format: str = 'csv', symbol: str = None,
+            mode: str = 'single', thumbnails: bool = False, max_workers: int = None):
+        """
+        mode: 'single'（單一股票報告）、'bundle'（報告包）或 'rank'（跨股票排名）
+        """
         # 載入資料
         df = self.load_summary(summary_path)
+        prefix = f"top{top_n or int(top_percent)}"
+
+        # 報告包：所有股票各自取 Top，一次輸出所有格式
+        if mode == 'bundle':
+            df = self.apply_conditions(df, conditions)
+            df_top = self.top_by_group(df, metric, ['symbol'], top_n, top_percent)
+            formats = self.FORMATS if export_format == 'all' else [export_format]
+            self.save_bundle(df_top, prefix, metric, formats, summary_path, thumbnails, max_workers)
+            print(f"已輸出報告包至 {self.reports_dir}")
+            return
+
+        # 跨股票排名：各股票/各策略 Top 與參數穩定度
+        if mode == 'rank':
+            df = self.apply_conditions(df, conditions)
+            for name, table in self.rank_across_symbols(df, metric, top_n, top_percent).items():
+                report_prefix = 'param' if name == 'stability' else prefix
+                self.save_reports(table, report_prefix, metric, export_format, name)
+            print(f"已輸出跨股票排名報告至 {self.reports_dir}")
+            return
         
         # 如果沒有指定股票代碼，顯示可用的股票列表並讓使用者選擇
         if symbol is None:
@@ -123,6 +270,5 @@ class ReportGenerator:
         df_top = self.filter_top(df, metric, top_n, top_percent)
         
         # 生成報告
-        prefix = f"top{top_n or int(top_percent)}"
         self.save_reports(df_top, prefix, metric, export_format, symbol)
         print(f"已輸出報告至 {self.reports_dir}") 
\ No newline at end of file
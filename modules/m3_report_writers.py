@@ -0,0 +1,143 @@
+import html
+import math
+from pathlib import Path
+import pandas as pd
+
+
+def _cell(value):
+    """轉為 Python 原生型別，NaN 轉為 None"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+    return value
+
+
+class CsvStreamWriter:
+    """分批寫入 CSV，只在第一批寫入欄位名稱"""
+    suffix = 'csv'
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.f = open(self.path, 'w', encoding='utf-8', newline='')
+        self.header = True
+
+    def write(self, chunk: pd.DataFrame):
+        chunk.to_csv(self.f, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.f.close()
+
+
+class XlsxStreamWriter:
+    """以 openpyxl write-only 模式逐列寫入 Excel，記憶體用量與列數無關"""
+    suffix = 'xlsx'
+
+    def __init__(self, path, sheet_name: str = 'report'):
+        from openpyxl import Workbook
+
+        self.path = Path(path)
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(sheet_name)
+        self.header = True
+
+    def write(self, chunk: pd.DataFrame):
+        if self.header:
+            self.ws.append([str(c) for c in chunk.columns])
+            self.header = False
+        for row in chunk.itertuples(index=False, name=None):
+            self.ws.append([_cell(v) for v in row])
+
+    def close(self):
+        self.wb.save(self.path)
+
+
+class HtmlStreamWriter:
+    """逐批輸出 HTML 表格列，格式與 DataFrame.to_html 相近"""
+    suffix = 'html'
+
+    def __init__(self, path, image_columns: tuple = ()):
+        self.path = Path(path)
+        self.f = open(self.path, 'w', encoding='utf-8')
+        self.image_columns = set(image_columns)
+        self.header = True
+
+    def write(self, chunk: pd.DataFrame):
+        if self.header:
+            cols = ''.join(f"<th>{html.escape(str(c))}</th>" for c in chunk.columns)
+            self.f.write(f'<table border="1" class="dataframe">\n<thead>\n<tr style="text-align: right;">{cols}</tr>\n</thead>\n<tbody>\n')
+            self.header = False
+        image_idx = {i for i, c in enumerate(chunk.columns) if c in self.image_columns}
+        lines = []
+        for row in chunk.itertuples(index=False, name=None):
+            cells = []
+            for i, v in enumerate(row):
+                v = _cell(v)
+                if i in image_idx and v:
+                    cells.append(f'<td><img src="{html.escape(str(v))}" height="60"></td>')
+                else:
+                    cells.append(f"<td>{'' if v is None else html.escape(str(v))}</td>")
+            lines.append(f"<tr>{''.join(cells)}</tr>\n")
+        self.f.write(''.join(lines))
+
+    def close(self):
+        if self.header:
+            self.f.write('<table border="1" class="dataframe">\n<tbody>\n')
+        self.f.write('</tbody>\n</table>\n')
+        self.f.close()
+
+
+WRITERS = {
+    'csv': CsvStreamWriter,
+    'xlsx': XlsxStreamWriter,
+    'html': HtmlStreamWriter,
+}
+
+
+def open_writers(base_path: Path, formats, image_columns: tuple = ()) -> list:
+    """依格式開啟多個串流寫入器，base_path 不含副檔名"""
+    writers = []
+    for fmt in formats:
+        path = base_path.with_name(f"{base_path.name}.{fmt}")
+        if fmt == 'html':
+            writers.append(HtmlStreamWriter(path, image_columns))
+        else:
+            writers.append(WRITERS[fmt](path))
+    return writers
+
+
+def write_chunks(writers: list, df: pd.DataFrame, chunk_size: int = 50_000):
+    """將 DataFrame 分批送入所有寫入器"""
+    for start in range(0, max(len(df), 1), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        for writer in writers:
+            writer.write(chunk)
+
+
+def close_writers(writers: list):
+    for writer in writers:
+        writer.close()
+
+
+def render_nav_thumbnail(task: tuple):
+    """子行程工作：將 NAV 繪製為小型 PNG 縮圖，回傳縮圖路徑（失敗回傳 None）"""
+    nav_path, png_path = task
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        nav = pd.read_parquet(nav_path)['nav']
+        fig, ax = plt.subplots(figsize=(2.4, 0.8), dpi=80)
+        ax.plot(nav.to_numpy(), linewidth=0.8)
+        ax.axis('off')
+        fig.savefig(png_path, bbox_inches='tight', pad_inches=0)
+        plt.close(fig)
+        return str(png_path)
+    except Exception:
+        return None
@@ -0,0 +1,155 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from utils.config import Config
+from utils.logger import get_logger
+from utils.sweep_manifest import atomic_write_csv
+
+
+def simulate_paths(returns: np.ndarray, n_sims: int, method: str = 'block', block_size: int = 20,
+                   rng: np.random.Generator = None, max_cells: int = 2_000_000):
+    """
+    以向量化方式模擬報酬路徑，回傳每條路徑的 (total_return, max_drawdown)
+
+    Args:
+        returns: 每日報酬序列
+        n_sims: 模擬次數
+        method: 'block'（循環區塊 bootstrap）或 'shuffle'（逐期報酬可重複抽樣重組）
+        block_size: 區塊長度（僅 block 使用）
+        rng: numpy 亂數產生器
+        max_cells: 每批模擬矩陣（模擬次數 × 期數）的元素上限，用以控制記憶體
+    """
+    rng = rng or np.random.default_rng()
+    returns = np.asarray(returns, dtype=np.float64)
+    T = len(returns)
+    total_returns = np.empty(n_sims)
+    max_drawdowns = np.empty(n_sims)
+    if T == 0:
+        total_returns[:] = 0.0
+        max_drawdowns[:] = 0.0
+        return total_returns, max_drawdowns
+
+    chunk = max(1, max_cells // T)
+    block_size = max(1, min(block_size, T))
+    n_blocks = -(-T // block_size)
+    offsets = np.arange(block_size)
+    for start in range(0, n_sims, chunk):
+        n = min(chunk, n_sims - start)
+        if method == 'block':
+            starts = rng.integers(0, T, size=(n, n_blocks))
+            idx = ((starts[:, :, None] + offsets) % T).reshape(n, -1)[:, :T]
+            sim = returns[idx]
+        elif method == 'shuffle':
+            # 逐期報酬可重複抽樣（i.i.d. bootstrap）；單純重排不會改變報酬乘積，總報酬區間將失去意義
+            sim = returns[rng.integers(0, T, size=(n, T))]
+        else:
+            raise ValueError(f"不支援的模擬方法: {method}")
+        # NAV 以 1 起始，最大回撤定義與 Backtester.calc_performance 一致
+        nav = np.cumprod(1 + sim, axis=1)
+        nav = np.concatenate([np.ones((n, 1)), nav], axis=1)
+        peak = np.maximum.accumulate(nav, axis=1)
+        total_returns[start:start + n] = nav[:, -1] - 1
+        max_drawdowns[start:start + n] = (peak - nav).max(axis=1) / peak.max(axis=1)
+    return total_returns, max_drawdowns
+
+
+def summarize_paths(total_returns: np.ndarray, max_drawdowns: np.ndarray, confidence: float = 0.95) -> dict:
+    """將模擬結果整理為信賴區間"""
+    alpha = (1 - confidence) / 2 * 100
+    tr_low, tr_mid, tr_high = np.percentile(total_returns, [alpha, 50, 100 - alpha])
+    dd_low, dd_mid, dd_high = np.percentile(max_drawdowns, [alpha, 50, 100 - alpha])
+    return {
+        'total_return_ci_low': float(tr_low),
+        'total_return_median': float(tr_mid),
+        'total_return_ci_high': float(tr_high),
+        'max_drawdown_ci_low': float(dd_low),
+        'max_drawdown_median': float(dd_mid),
+        'max_drawdown_ci_high': float(dd_high),
+        'prob_loss': float((total_returns < 0).mean()),
+    }
+
+
+def _analyze_nav_file(task: tuple) -> dict:
+    """子行程工作：讀取單一 NAV 檔並模擬"""
+    nav_path, n_sims, method, block_size, confidence, seed, max_cells = task
+    nav = pd.read_parquet(nav_path)['nav']
+    returns = nav.pct_change().dropna().to_numpy()
+    rng = np.random.default_rng(seed)
+    tr, dd = simulate_paths(returns, n_sims, method, block_size, rng, max_cells)
+    return summarize_paths(tr, dd, confidence)
+
+
+class RobustnessAnalyzer:
+    """
+    M4: 穩健度分析模組
+    功能:
+      - 對回測 NAV 進行區塊 bootstrap 或逐期報酬重抽的蒙地卡羅模擬
+      - 模擬以（模擬次數 × 期數）矩陣向量化計算，分批控制記憶體
+      - 多組參數以多行程平行處理
+      - 產生 total_return / max_drawdown 信賴區間並附加至 performance_master
+    """
+    METHODS = ('block', 'shuffle')
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.results_dir = config.results_dir
+        self.logger = get_logger(__name__)
+
+    def analyze_nav(self, nav: pd.DataFrame, n_sims: int = 2000, method: str = 'block', block_size: int = 20,
+                    confidence: float = 0.95, seed: int = None, max_cells: int = 2_000_000) -> dict:
+        """分析單一 NAV（如 Backtester.run_backtest 的輸出）"""
+        returns = nav['nav'].pct_change().dropna().to_numpy()
+        rng = np.random.default_rng(seed)
+        tr, dd = simulate_paths(returns, n_sims, method, block_size, rng, max_cells)
+        return summarize_paths(tr, dd, confidence)
+
+    def find_nav_file(self, result_dir: Path, row: pd.Series) -> Path:
+        return result_dir / f"nav_{row['strategy']}_{row['symbol']}_{row['param_id']}.parquet"
+
+    def run(self, result_dir: str, n_sims: int = 2000, method: str = 'block', block_size: int = 20,
+            confidence: float = 0.95, max_workers: int = None, seed: int = None,
+            max_cells: int = 2_000_000) -> pd.DataFrame:
+        """
+        對 results 子資料夾內所有回測進行穩健度分析
+
+        Args:
+            result_dir: results 子資料夾（含 performance_master.csv 與 nav_*.parquet）
+            n_sims: 每組參數模擬次數
+            method: 'block' 或 'shuffle'
+            block_size: bootstrap 區塊長度（交易日）
+            confidence: 信賴水準
+            max_workers: 平行行程數（1 則不開子行程）
+            seed: 亂數種子，相同種子結果可重現
+            max_cells: 每批模擬矩陣元素上限
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"不支援的模擬方法: {method}")
+        result_dir = Path(result_dir)
+        master_path = result_dir / "performance_master.csv"
+        master = pd.read_csv(master_path, dtype={'param_id': str})
+
+        tasks, rows = [], []
+        seeds = np.random.SeedSequence(seed).spawn(len(master))
+        for (i, row), child in zip(master.iterrows(), seeds):
+            nav_path = self.find_nav_file(result_dir, row)
+            if not nav_path.exists():
+                self.logger.warning(f"找不到 NAV 檔案，略過：{nav_path}")
+                continue
+            tasks.append((str(nav_path), n_sims, method, block_size, confidence, child, max_cells))
+            rows.append(i)
+
+        self.logger.info(f"開始穩健度分析：{len(tasks)} 組參數 × {n_sims} 次模擬（{method}）")
+        if max_workers == 1 or len(tasks) <= 1:
+            summaries = [_analyze_nav_file(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                summaries = list(pool.map(_analyze_nav_file, tasks, chunksize=max(1, len(tasks) // (4 * (max_workers or os.cpu_count() or 1)))))
+
+        robust = pd.DataFrame(summaries, index=rows)
+        master = master.drop(columns=[c for c in robust.columns if c in master.columns])
+        master = master.join(robust)
+        atomic_write_csv(master, master_path)
+        self.logger.info(f"已將穩健度分析結果寫入 {master_path}")
+        return master
@@ -0,0 +1,180 @@
+import os
+import json
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from utils.config import Config
+from utils.logger import get_logger
+
+
+def box_filter(values: np.ndarray, radius: int) -> np.ndarray:
+    """
+    N 維方框濾波（各軸半徑 radius 的鄰域加總）
+
+    以各軸累積和實作可分離卷積，計算量與格點數成正比，不受鄰域大小影響。
+    """
+    out = values
+    for axis in range(values.ndim):
+        pad = [(0, 0)] * values.ndim
+        pad[axis] = (radius + 1, radius)
+        csum = np.cumsum(np.pad(out, pad), axis=axis)
+        n = out.shape[axis]
+        upper = np.take(csum, np.arange(2 * radius + 1, 2 * radius + 1 + n), axis=axis)
+        lower = np.take(csum, np.arange(0, n), axis=axis)
+        out = upper - lower
+    return out
+
+
+class ParamSurfaceAnalyzer:
+    """
+    M5: 參數平面分析模組
+    功能:
+      - 由績效總表（params 欄位）將結果轉為 N 維參數格點陣列
+      - 以鄰域平均（方框卷積）評估最佳參數是位於穩定高原或孤立尖峰
+      - 輸出逐參數鄰域指標與二維熱度圖，不需重新回測
+    """
+    def __init__(self, config: Config):
+        self.config = config
+        self.reports_dir = Path(config.reports_dir) / "surface"
+        self.logger = get_logger(__name__)
+
+    @staticmethod
+    def expand_params(df: pd.DataFrame) -> pd.DataFrame:
+        """將 params JSON 展開為各參數欄位（只解析不重複的字串）"""
+        unique = df['params'].astype(str).unique()
+        parsed = pd.DataFrame([json.loads(p) for p in unique], index=unique)
+        return parsed.reindex(df['params'].astype(str).to_numpy()).set_index(df.index)
+
+    def build_grid(self, df: pd.DataFrame, metric: str, axes: list = None):
+        """
+        建立稠密參數格點
+
+        Returns:
+            grid: N 維陣列（無資料的格點為 NaN，同格多筆取平均）
+            axes: 參數名稱列表
+            levels: 各軸排序後的參數值
+            cell_index: 每列資料對應的格點位置（攤平後索引）
+        """
+        params = self.expand_params(df)
+        axes = axes or [c for c in params.columns if params[c].notna().all() and params[c].nunique() > 1]
+        levels, codes = [], []
+        for axis in axes:
+            code, uniques = pd.factorize(params[axis], sort=True)
+            levels.append(uniques.to_numpy())
+            codes.append(code)
+        shape = tuple(len(l) for l in levels)
+        cell_index = np.ravel_multi_index(codes, shape) if axes else np.zeros(len(df), dtype=np.int64)
+        size = int(np.prod(shape)) if axes else 1
+        metric_values = df[metric].to_numpy(dtype=np.float64)
+        sums = np.bincount(cell_index, weights=metric_values, minlength=size)
+        counts = np.bincount(cell_index, minlength=size)
+        with np.errstate(invalid='ignore'):
+            grid = (sums / counts).reshape(shape if axes else (1,))
+        return grid, axes, levels, cell_index
+
+    def smooth_grid(self, grid: np.ndarray, radius: int = 1) -> tuple:
+        """鄰域平均與鄰域標準差（忽略無資料格點）"""
+        mask = ~np.isnan(grid)
+        filled = np.where(mask, grid, 0.0)
+        n = box_filter(mask.astype(np.float64), radius)
+        s = box_filter(filled, radius)
+        s2 = box_filter(filled ** 2, radius)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s / n
+            std = np.sqrt(np.maximum(s2 / n - mean ** 2, 0.0))
+        return mean, std, n
+
+    def analyze(self, df: pd.DataFrame, metric: str, radius: int = 1, axes: list = None) -> tuple:
+        """單一 (策略, 股票) 的鄰域分析，回傳 (逐列結果, 格點資訊)"""
+        grid, axes, levels, cell_index = self.build_grid(df, metric, axes)
+        mean, std, n = self.smooth_grid(grid, radius)
+        result = df.copy()
+        result[f'{metric}_smooth'] = mean.ravel()[cell_index]
+        result[f'{metric}_neighbor_std'] = std.ravel()[cell_index]
+        result['n_neighbors'] = n.ravel()[cell_index].astype(int)
+        # 尖峰程度：自身值高於鄰域平均的幅度，越大越可能是孤立尖峰
+        result['spike'] = result[metric] - result[f'{metric}_smooth']
+        return result.sort_values(f'{metric}_smooth', ascending=False), (grid, mean, axes, levels)
+
+    def heatmap_table(self, grid: np.ndarray, axes: list, levels: list, x: str, y: str) -> pd.DataFrame:
+        """將 N 維格點投影為 x × y 熱度表，其餘參數軸取最大值"""
+        ix, iy = axes.index(x), axes.index(y)
+        other = tuple(i for i in range(grid.ndim) if i not in (ix, iy))
+        with warnings.catch_warnings():
+            # 整條投影皆無資料時 nanmax 會警告，結果保留 NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            plane = np.nanmax(grid, axis=other) if other else grid
+        if ix > iy:
+            plane = plane.T
+        return pd.DataFrame(plane.T, index=pd.Index(levels[iy], name=y), columns=pd.Index(levels[ix], name=x))
+
+    def render_heatmap(self, table: pd.DataFrame, path: Path, title: str) -> bool:
+        """以 matplotlib 繪製熱度圖（未安裝時略過）"""
+        try:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+        except ImportError:
+            return False
+        fig, ax = plt.subplots(figsize=(8, 6), dpi=100)
+        im = ax.imshow(table.to_numpy(), origin='lower', aspect='auto', cmap='viridis')
+        ax.set_xticks(range(len(table.columns)))
+        ax.set_xticklabels(table.columns, rotation=90, fontsize=6)
+        ax.set_yticks(range(len(table.index)))
+        ax.set_yticklabels(table.index, fontsize=6)
+        ax.set_xlabel(table.columns.name)
+        ax.set_ylabel(table.index.name)
+        ax.set_title(title)
+        fig.colorbar(im, ax=ax)
+        fig.savefig(path, bbox_inches='tight')
+        plt.close(fig)
+        return True
+
+    def run(self, summary_path: str, metric: str = 'total_return', radius: int = 1, strategy: str = None,
+            symbol: str = None, heatmap_axes: tuple = None) -> list:
+        """
+        對績效總表中每個 (策略, 股票) 進行參數平面分析
+
+        Args:
+            summary_path: performance_master.csv 路徑
+            metric: 分析指標
+            radius: 鄰域半徑（格點數）
+            strategy / symbol: 僅分析指定策略或股票
+            heatmap_axes: 熱度圖的 (x, y) 參數名稱，預設為前兩個參數軸
+        """
+        df = pd.read_csv(summary_path, dtype={'param_id': str})
+        if strategy:
+            df = df[df['strategy'] == strategy]
+        if symbol:
+            df = df[df['symbol'] == symbol]
+        os.makedirs(self.reports_dir, exist_ok=True)
+        if heatmap_axes and len(heatmap_axes) != 2:
+            self.logger.warning(f"熱度圖座標軸須為兩個參數名稱（收到 {heatmap_axes}），改用預設座標軸")
+            heatmap_axes = None
+
+        outputs = []
+        for (strat, sym), group in df.groupby(['strategy', 'symbol'], sort=True):
+            result, (grid, smooth, axes, levels) = self.analyze(group, metric, radius)
+            base = f"{strat}_{sym}_{metric}"
+            result_path = self.reports_dir / f"surface_{base}.csv"
+            result.to_csv(result_path, index=False)
+            outputs.append(result_path)
+            self.logger.info(f"{strat} {sym}：{grid.size} 個格點（{' × '.join(f'{a}={len(l)}' for a, l in zip(axes, levels))}），已輸出 {result_path}")
+
+            if len(axes) < 2 and not heatmap_axes:
+                continue
+            x, y = heatmap_axes if heatmap_axes else (axes[0], axes[1])
+            # 指定的座標軸須為此群組中有變化的參數（不同策略參數不同，或參數於群組內固定）
+            if x == y or x not in axes or y not in axes:
+                self.logger.warning(f"{strat} {sym} 的參數軸為 {', '.join(axes)}，不含熱度圖座標軸 {x}, {y}，略過熱度圖")
+                continue
+            for label, values in (('raw', grid), ('smooth', smooth)):
+                table = self.heatmap_table(values, axes, levels, x, y)
+                table_path = self.reports_dir / f"heatmap_{base}_{label}_{x}_{y}.csv"
+                table.to_csv(table_path)
+                outputs.append(table_path)
+                png_path = table_path.with_suffix('.png')
+                if self.render_heatmap(table, png_path, f"{strat} {sym} {metric} ({label})"):
+                    outputs.append(png_path)
+        return outputs
@@ -22,6 +22,18 @@ class Config:
     download_delay: float = 5.0  # 增加下載延遲（秒）
     max_retries: int = 10  # 增加最大重試次數
     save_to_db: bool = False  # 是否儲存至資料庫
+    max_workers: int = 1  # 同時下載股票數量
+    download_jitter: tuple = (2.0, 5.0)  # 每次請求額外隨機延遲範圍（秒）
+    retry_base: float = 2.0  # 指數退避底數
+    retry_jitter: tuple = (5.0, 10.0)  # 重試額外隨機等待範圍（秒）
+
+    # 資料來源設定
+    data_source: str = 'yfinance'  # yfinance / fake（離線模擬）
+    use_replay_cache: bool = False  # 是否將下載結果快取於磁碟並重播
+    cache_dir: Path = Path("data/.cache")
+
+    # 記憶體設定
+    price_dtype: str = 'float64'  # 價格欄位精度，大量股票時可改為 'float32' 減半記憶體
 
     @classmethod
     def load(cls) -> 'Config':
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+# 信號值僅有 -1 / 0 / 1
+SIGNAL_DTYPE = np.int8
+# performance_master 中重複度高的文字欄位
+CATEGORY_COLUMNS = ['strategy', 'symbol', 'sweep_id']
+
+
+def downcast_prices(df: pd.DataFrame, float_dtype: str = 'float64') -> pd.DataFrame:
+    """價格欄位轉為指定浮點精度，整數欄位（如 volume）縮減為可容納的最小整數型別"""
+    if df is None:
+        return df
+    float_cols = df.select_dtypes(include='floating').columns
+    int_cols = df.select_dtypes(include='integer').columns
+    if len(float_cols):
+        df[float_cols] = df[float_cols].astype(float_dtype)
+    for col in int_cols:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def downcast_signals(df: pd.DataFrame) -> pd.DataFrame:
+    """signal 欄位轉為 int8"""
+    if df is None or 'signal' not in df.columns:
+        return df
+    df['signal'] = df['signal'].fillna(0).astype(SIGNAL_DTYPE)
+    return df
+
+
+def categorize_results(df: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """將績效表中重複度高的文字欄位轉為 category"""
+    for col in columns or CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def memory_usage_mb(df: pd.DataFrame) -> float:
+    """DataFrame 實際記憶體用量（MB，含 index 與物件欄位內容）"""
+    return df.memory_usage(index=True, deep=True).sum() / 1024 ** 2
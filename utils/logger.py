@@ -0,0 +1,15 @@
+import logging
+
+_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """取得 logger，整個行程只設定一次 root logger"""
+    global _configured
+    if not _configured:
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+        _configured = True
+    return logging.getLogger(name)
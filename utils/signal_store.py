@@ -0,0 +1,131 @@
+import os
+import json
+import re
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+class SignalEventStore:
+    """
+    信號事件儲存格式（events）
+
+    功能:
+      - 只記錄信號狀態改變的事件（日期索引 int32 + 信號值 int8）
+      - 同一批次所有 param_id 合併為單一 Parquet 檔（param_id 欄位區分）
+      - 交易日曆存於 Parquet metadata，讀取時依 param_id 展開為完整信號序列
+
+    檔名格式: signal_events_<策略名稱>_<股票代碼>.parquet
+    """
+    PREFIX = "signal_events_"
+    SUFFIX = ".parquet"
+    DATES_KEY = b"quanta_dates"
+    PARAM_IDS_KEY = b"quanta_param_ids"
+    NAME_PATTERN = re.compile(r"^signal_events_(?P<strategy>.+)_(?P<symbol>[^_]+)\.parquet$")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._events = None
+        self._dates = None
+        self._groups = None
+
+    @classmethod
+    def filename(cls, strategy: str, symbol: str) -> str:
+        return f"{cls.PREFIX}{strategy}_{symbol}{cls.SUFFIX}"
+
+    @classmethod
+    def is_event_file(cls, path) -> bool:
+        return cls.NAME_PATTERN.match(Path(path).name) is not None
+
+    @classmethod
+    def parse_name(cls, path):
+        """解析檔名，回傳 (strategy, symbol)"""
+        m = cls.NAME_PATTERN.match(Path(path).name)
+        if m is None:
+            raise ValueError(f"非信號事件檔案: {path}")
+        return m.group('strategy'), m.group('symbol')
+
+    @staticmethod
+    def encode(signal) -> tuple:
+        """將完整信號序列轉為 (事件位置, 事件值)，序列起點前視為 0"""
+        values = np.asarray(signal, dtype=np.int8)
+        prev = np.concatenate(([0], values[:-1])).astype(np.int8)
+        idx = np.flatnonzero(values != prev).astype(np.int32)
+        return idx, values[idx]
+
+    @staticmethod
+    def decode(idx, values, length: int) -> np.ndarray:
+        """將事件還原為長度為 length 的完整信號序列"""
+        out = np.zeros(length, dtype=np.int8)
+        if len(idx) == 0:
+            return out
+        values = np.asarray(values, dtype=np.int8)
+        out[np.asarray(idx)] = np.diff(values, prepend=np.int8(0))
+        return np.cumsum(out, dtype=np.int8)
+
+    @classmethod
+    def write(cls, path, dates: pd.DatetimeIndex, events: dict):
+        """
+        寫入信號事件檔
+
+        Args:
+            path: 輸出路徑
+            dates: 交易日曆（所有 param_id 共用）
+            events: {param_id: (idx, values)}
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        param_ids = sorted(events)
+        lengths = [len(events[p][0]) for p in param_ids]
+        df = pd.DataFrame({
+            'param_id': pd.Categorical(np.repeat(param_ids, lengths), categories=param_ids),
+            'date_idx': np.concatenate([events[p][0] for p in param_ids] or [np.array([], dtype=np.int32)]).astype(np.int32),
+            'signal': np.concatenate([events[p][1] for p in param_ids] or [np.array([], dtype=np.int8)]).astype(np.int8),
+        })
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[cls.DATES_KEY] = json.dumps([d.isoformat() for d in pd.DatetimeIndex(dates)]).encode('utf-8')
+        # 全程無信號的參數組合沒有事件列，另存 param_id 清單
+        metadata[cls.PARAM_IDS_KEY] = json.dumps(param_ids).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+        # 先寫暫存檔再替換，避免中斷時留下損壞的事件檔
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+
+    def _load(self):
+        if self._events is not None:
+            return
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(self.path)
+        self._dates = pd.DatetimeIndex(json.loads(table.schema.metadata[self.DATES_KEY]))
+        self._events = table.to_pandas()
+        self._events['param_id'] = self._events['param_id'].astype(str)
+        empty = (np.array([], dtype=np.int32), np.array([], dtype=np.int8))
+        self._groups = {pid: empty for pid in json.loads(table.schema.metadata[self.PARAM_IDS_KEY])}
+        for pid, g in self._events.groupby('param_id', sort=True):
+            self._groups[pid] = (g['date_idx'].to_numpy(), g['signal'].to_numpy())
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        self._load()
+        return self._dates
+
+    def param_ids(self) -> list:
+        self._load()
+        return sorted(self._groups)
+
+    def events(self) -> dict:
+        """回傳 {param_id: (idx, values)}"""
+        self._load()
+        return dict(self._groups)
+
+    def expand(self, param_id: str) -> pd.DataFrame:
+        """展開單一 param_id 為與原 signal 檔相同格式的 DataFrame"""
+        self._load()
+        idx, values = self._groups[param_id]
+        signal = self.decode(idx, values, len(self._dates))
+        return pd.DataFrame({'signal': signal}, index=self._dates)
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+
+def atomic_write_text(path, text: str, encoding: str = 'utf-8'):
+    """以暫存檔 + os.replace 原子寫入文字檔，中斷時不會留下半寫入的檔案"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_csv(df, path, **kwargs):
+    """原子寫入 DataFrame 為 CSV"""
+    kwargs.setdefault('index', False)
+    atomic_write_text(path, df.to_csv(**kwargs))
+
+
+class SweepManifest:
+    """
+    批次掃描（sweep）進度清單
+
+    功能:
+      - 記錄已完成的 (symbol, strategy, param_id) 單位，可附帶設定指紋（fingerprint）
+      - 以 append-only JSON Lines 逐筆寫入並 fsync，中斷後最多遺失最後一筆
+      - 記錄批次設定（參數組合、日期區間等），續跑時沿用同一組參數
+    """
+    FILENAME = "sweep_manifest.jsonl"
+
+    def __init__(self, directory, filename: str = None):
+        self.directory = Path(directory)
+        self.path = self.directory / (filename or self.FILENAME)
+        self.meta = {}
+        self.completed = {}
+        self._load()
+
+    @staticmethod
+    def make_key(symbol: str, strategy: str, param_id: str) -> str:
+        return f"{symbol}|{strategy}|{param_id}"
+
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        """將設定值（需可 JSON 序列化）雜湊為短字串，設定改變時指紋不同"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+    def _load(self):
+        """載入既有清單，忽略中斷時寫到一半的最後一行"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get('type') == 'meta':
+                    self.meta = entry.get('meta', {})
+                elif entry.get('type') == 'done':
+                    key = self.make_key(entry['symbol'], entry['strategy'], entry['param_id'])
+                    self.completed[key] = entry.get('fingerprint')
+
+    def _append(self, entry: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def matches(self, meta: dict, keys) -> bool:
+        """既有批次設定在指定欄位上是否與 meta 相同"""
+        return bool(self.meta) and all(self.meta.get(k) == meta.get(k) for k in keys)
+
+    def set_meta(self, meta: dict):
+        """記錄批次設定（僅在首次建立時寫入）"""
+        if self.meta:
+            return
+        self.meta = meta
+        self._append({'type': 'meta', 'meta': meta})
+
+    def reset(self, meta: dict = None):
+        """捨棄既有進度，以新的批次設定重新開始"""
+        self.meta = meta or {}
+        self.completed = {}
+        self.compact()
+
+    def is_done(self, symbol: str, strategy: str, param_id: str, fingerprint: str = None) -> bool:
+        """已完成且（有指定時）指紋相同才視為完成"""
+        key = self.make_key(symbol, strategy, param_id)
+        return key in self.completed and (fingerprint is None or self.completed[key] == fingerprint)
+
+    def mark_done(self, symbol: str, strategy: str, param_id: str, fingerprint: str = None):
+        key = self.make_key(symbol, strategy, param_id)
+        if key in self.completed and self.completed[key] == fingerprint:
+            return
+        entry = {'type': 'done', 'symbol': symbol, 'strategy': strategy, 'param_id': param_id}
+        if fingerprint is not None:
+            entry['fingerprint'] = fingerprint
+        self._append(entry)
+        self.completed[key] = fingerprint
+
+    def compact(self):
+        """將清單重寫為精簡版本（去除重複、過期指紋與損壞行）"""
+        lines = []
+        if self.meta:
+            lines.append(json.dumps({'type': 'meta', 'meta': self.meta}, ensure_ascii=False))
+        for key in sorted(self.completed):
+            symbol, strategy, param_id = key.split('|')
+            entry = {'type': 'done', 'symbol': symbol, 'strategy': strategy, 'param_id': param_id}
+            if self.completed[key] is not None:
+                entry['fingerprint'] = self.completed[key]
+            lines.append(json.dumps(entry, ensure_ascii=False))
+        atomic_write_text(self.path, ''.join(line + '\n' for line in lines))